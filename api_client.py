@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+"""
+共享的 HTTP API 客户端
+每个客户端持有一个带连接池的 requests.Session，同一进程内按名称与配置复用（见 get_client）:
+    - 每个主机一个令牌桶限速，并按 Pexels 的 X-Ratelimit-Remaining / X-Ratelimit-Reset 收紧；
+      需要等待超过 max_backoff 才有配额时（如 Pexels 月度配额用尽）直接抛出 RateLimitExhausted，由调用方降级
+    - 只对 429、5xx 与连接错误按带抖动的指数退避重试，优先采用 Retry-After；成功后不等待
+    - 记录请求数、重试数、状态码分布、延迟与限速等待时间；计数为进程内累计，
+      单个任务的统计用 snapshot() 记下起点，再用 stats(since=...) 取增量
+"""
+
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+
+class RateLimitExhausted(requests.RequestException):
+    """服务端配额已用尽，重置时间超出可等待的上限"""
+
+
+class TokenBucket:
+    """令牌桶：每秒补充 rate 个令牌，最多积累 capacity 个；pause() 可让整个桶暂停到指定时间"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self, max_wait=None):
+        """
+        取一个令牌，不足时等待，返回等待的秒数
+        桶被暂停且剩余暂停时间超过 max_wait 时不等待，抛出 RateLimitExhausted
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                delay = self.blocked_until - now
+                if max_wait is not None and delay > max_wait:
+                    raise RateLimitExhausted(f"配额已用尽，{delay:.0f}s 后重置")
+                if delay <= 0:
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return waited
+                    delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+    def pause(self, delay):
+        with self._lock:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + delay)
+
+    def observe(self, remaining, reset_in=None):
+        """
+        按服务端返回的剩余配额收紧：本地令牌不超过剩余次数，
+        配额用尽时暂停到重置时间（未知时暂停 60 秒），暂停过长时由 acquire(max_wait) 直接抛出
+        """
+        with self._lock:
+            self.tokens = min(self.tokens, remaining)
+        if remaining <= 0:
+            self.pause(reset_in if reset_in is not None else 60)
+
+
+class ApiClient:
+    """
+    带连接池、限速、重试与统计的 HTTP 客户端，可在多个线程间共享
+    request() 返回最后一次的响应，不对 4xx 抛异常，由调用方 raise_for_status()
+    """
+
+    def __init__(self, name, rate=5.0, burst=10, max_retries=5, backoff_base=0.5, max_backoff=30.0,
+                 pool_size=8, retry_timeouts=True):
+        self.name = name
+        # 超时本身已等待了完整的 timeout，长超时的请求（如生成剧本）不应再重试
+        self.retry_timeouts = retry_timeouts
+        self.rate = rate
+        self.burst = burst
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.max_backoff = max_backoff
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._buckets = {}  # 主机 -> TokenBucket
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.retries = 0
+        self.failures = 0
+        self.status_counts = {}
+        self.latencies = []
+        self.throttled_s = 0.0
+
+    def bucket(self, url):
+        host = urlsplit(url).netloc
+        with self._lock:
+            if host not in self._buckets:
+                self._buckets[host] = TokenBucket(self.rate, self.burst)
+            return self._buckets[host]
+
+    def backoff_delay(self, attempt, response=None):
+        """带完全抖动的指数退避；响应带 Retry-After（秒）时至少等待该时长"""
+        delay = random.uniform(0, min(self.max_backoff, self.backoff_base * 2 ** attempt))
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after:
+            try:
+                delay = max(delay, min(float(retry_after), self.max_backoff))
+            except ValueError:
+                pass
+        return delay
+
+    def request(self, method, url, **kwargs):
+        bucket = self.bucket(url)
+        for attempt in range(self.max_retries + 1):
+            waited = bucket.acquire(max_wait=self.max_backoff)
+            started = time.perf_counter()
+            response = None
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt == self.max_retries or (isinstance(e, requests.Timeout) and not self.retry_timeouts):
+                    self._record(time.perf_counter() - started, waited, None, failed=True)
+                    raise
+            self._record(time.perf_counter() - started, waited, response)
+
+            if response is not None:
+                self._observe_rate_limit(bucket, response)
+                if response.status_code not in RETRY_STATUS or attempt == self.max_retries:
+                    if response.status_code >= 400:
+                        with self._lock:
+                            self.failures += 1
+                    return response
+
+            delay = self.backoff_delay(attempt, response)
+            status = response.status_code if response is not None else "连接错误"
+            print(f"[{self.name}] {status}，{delay:.1f}s 后重试 ({attempt + 1}/{self.max_retries})")
+            with self._lock:
+                self.retries += 1
+            # 限流与服务端错误时同一主机的其他请求也一起退避
+            bucket.pause(delay)
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    @staticmethod
+    def _observe_rate_limit(bucket, response):
+        remaining = response.headers.get("X-Ratelimit-Remaining")
+        if remaining is None:
+            return
+        try:
+            remaining = int(remaining)
+        except ValueError:
+            return
+        reset_in = None
+        reset = response.headers.get("X-Ratelimit-Reset")
+        if reset:
+            try:
+                # Pexels 返回配额重置的 Unix 时间戳
+                reset_in = max(0.0, float(reset) - time.time())
+            except ValueError:
+                pass
+        if remaining <= 0:
+            print(f"[限速] 配额已用尽，{reset_in if reset_in is not None else 60:.0f}s 后重置")
+        bucket.observe(remaining, reset_in)
+
+    def _record(self, latency, waited, response, failed=False):
+        with self._lock:
+            self.requests += 1
+            self.latencies.append(latency)
+            self.throttled_s += waited
+            status = response.status_code if response is not None else "error"
+            self.status_counts[status] = self.status_counts.get(status, 0) + 1
+            if failed:
+                self.failures += 1
+
+    def snapshot(self):
+        """当前累计计数，传给 stats(since=...) 只统计此后的请求"""
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "retries": self.retries,
+                "failures": self.failures,
+                "status": dict(self.status_counts),
+                "throttled_s": self.throttled_s,
+                "latencies": len(self.latencies),
+            }
+
+    def stats(self, since=None):
+        """累计统计；since 为 snapshot() 的返回值时只统计快照之后的请求"""
+        since = since or {}
+        with self._lock:
+            latencies = sorted(self.latencies[since.get("latencies", 0):])
+            status = {}
+            for code, count in self.status_counts.items():
+                count -= since.get("status", {}).get(code, 0)
+                if count:
+                    status[code] = count
+            stats = {
+                "requests": self.requests - since.get("requests", 0),
+                "retries": self.retries - since.get("retries", 0),
+                "failures": self.failures - since.get("failures", 0),
+                "status": status,
+                "throttled_s": round(self.throttled_s - since.get("throttled_s", 0.0), 3),
+            }
+        if latencies:
+            stats.update({
+                "latency_mean_ms": round(sum(latencies) / len(latencies) * 1000, 1),
+                "latency_p50_ms": round(latencies[len(latencies) // 2] * 1000, 1),
+                "latency_p95_ms": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000, 1),
+                "latency_max_ms": round(latencies[-1] * 1000, 1),
+            })
+        return stats
+
+    def close(self):
+        self.session.close()
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(name, **kwargs):
+    """
+    按名称与配置取进程内共享的客户端，不存在时用 kwargs 创建
+    同一进程内名称与配置都相同的调用方（如批量渲染的各个任务）共用连接池、限速桶与统计；
+    配置不同时是各自独立的客户端，限速也各自计算
+    """
+    key = (name, tuple(sorted(kwargs.items())))
+    with _clients_lock:
+        if key not in _clients:
+            _clients[key] = ApiClient(name, **kwargs)
+        return _clients[key]
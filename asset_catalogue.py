@@ -0,0 +1,335 @@
+# -*- coding: utf-8 -*-
+"""
+素材目录索引
+对 memes/ 下每个素材目录与 detail.json 建立 JSON 索引 (memes/.asset_catalogue.json)，记录:
+    渲染时使用的帧来源 (video / pack / png)、帧数、帧率、尺寸、PNG 命名、音频与时长、是否已抠像
+刷新时只对素材目录与已知文件做 stat，修改时间未变的条目直接沿用，不列目录、不读文件；
+渲染时按 id 直接查表，校验脚本也只查询索引
+    python asset_catalogue.py              # 增量刷新并打印统计
+    python asset_catalogue.py --rebuild    # 忽略旧索引全部重建
+"""
+
+import argparse
+import json
+import os
+import wave
+
+from asset_meta import META_FILE, load_meta, sequence_fps
+from asset_pack import HEADER, MAGIC, PACK_FILE
+
+CATALOGUE_FILE = ".asset_catalogue.json"
+DETAIL_FILE = "detail.json"
+VERSION = 2
+VIDEO_EXTENSIONS = ('.mp4', '.mov', '.avi', '.mkv')
+AUDIO_FILES = ("audio.wav", "audio.mp3")
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _png_naming(files):
+    """帧文件为从 0 开始的连续编号时只记录命名格式，否则记录完整文件列表"""
+    for width in (4, 5):
+        fmt = f"{{:0{width}d}}.png"
+        if all(name == fmt.format(i) for i, name in enumerate(files)):
+            return {"png_format": fmt}
+    return {"png_files": files}
+
+
+def _png_from_meta(png_dir, meta):
+    """
+    元数据记录了命名格式与帧数时只核对首尾帧是否存在，不列目录
+    与实际文件不符（缺帧、帧数变化）时返回 None，由调用方列目录
+    """
+    fmt, count = meta.get('png_format'), meta.get('frame_count')
+    if not fmt or not count:
+        return None
+    exists = lambda i: os.path.exists(os.path.join(png_dir, fmt.format(i)))
+    if exists(0) and exists(count - 1) and not exists(count):
+        return {"png_count": count, "png_format": fmt}
+    return None
+
+
+def _video_info(path):
+    import cv2
+
+    cap = cv2.VideoCapture(path)
+    try:
+        fps = cap.get(cv2.CAP_PROP_FPS) or None
+        return {
+            "fps": fps,
+            "frame_count": int(cap.get(cv2.CAP_PROP_FRAME_COUNT)),
+            "width": int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            "height": int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+        }
+    finally:
+        cap.release()
+
+
+def _pack_info(path):
+    with open(path, 'rb') as f:
+        magic, version, flags, count, fps, width, height, data_offset = HEADER.unpack(f.read(HEADER.size))
+    if magic != MAGIC:
+        return None
+    return {"fps": fps, "frame_count": count, "width": width, "height": height}
+
+
+def _audio_duration(path):
+    if not path.endswith('.wav'):
+        return None
+    try:
+        with wave.open(path, 'rb') as wf:
+            return wf.getnframes() / wf.getframerate()
+    except (wave.Error, EOFError, OSError):
+        return None
+
+
+def scan_asset(asset_dir):
+    """读取一个素材目录，返回索引条目"""
+    names = os.listdir(asset_dir)
+    entry = {"signature": None, "video": None, "pack": False, "png_count": 0, "audio": None,
+             "audio_duration": None, "keyed": False, "fps": None, "frame_count": 0,
+             "width": None, "height": None}
+
+    videos = sorted(n for n in names if n.lower().endswith(VIDEO_EXTENSIONS))
+    if videos:
+        entry["video"] = videos[0]
+    entry["pack"] = PACK_FILE in names
+    meta = load_meta(asset_dir)
+    png_dir = os.path.join(asset_dir, "png")
+    if os.path.isdir(png_dir):
+        naming = _png_from_meta(png_dir, meta)
+        if naming:
+            entry.update(naming)
+        else:
+            files = sorted(f for f in os.listdir(png_dir) if f.endswith('.png'))
+            entry["png_count"] = len(files)
+            if files:
+                entry.update(_png_naming(files))
+    for audio in AUDIO_FILES:
+        if audio in names:
+            entry["audio"] = audio
+            entry["audio_duration"] = _audio_duration(os.path.join(asset_dir, audio))
+            break
+
+    entry["keyed"] = bool(meta.get('keyed'))
+
+    # 与渲染器的选择顺序一致：已抠像的帧优先，其次视频、打包帧、PNG 序列
+    frame_kinds = [k for k, present in (("pack", entry["pack"]), ("png", entry["png_count"] > 0)) if present]
+    if entry["keyed"] and frame_kinds:
+        entry["kind"] = frame_kinds[0]
+    elif entry["video"]:
+        entry["kind"] = "video"
+    elif frame_kinds:
+        entry["kind"] = frame_kinds[0]
+    else:
+        entry["kind"] = None
+
+    info = None
+    if entry["kind"] == "video":
+        info = _video_info(os.path.join(asset_dir, entry["video"]))
+    elif entry["kind"] == "pack":
+        info = _pack_info(os.path.join(asset_dir, PACK_FILE))
+    elif entry["kind"] == "png":
+        from PIL import Image
+
+        first = entry.get("png_files", [None])[0] or entry["png_format"].format(0)
+        with Image.open(os.path.join(png_dir, first)) as img:
+            width, height = img.size
+        info = {"fps": sequence_fps(asset_dir), "frame_count": entry["png_count"], "width": width, "height": height}
+    if info:
+        entry.update(info)
+
+    entry["signature"] = asset_signature(asset_dir, entry)
+    return entry
+
+
+def asset_signature(asset_dir, entry=None):
+    """
+    素材目录、png/ 目录与条目中用到的文件的修改时间，任一变化即需重新读取
+    增删文件会改变所在目录的修改时间，原地改写文件会改变该文件的修改时间
+    """
+    paths = [asset_dir, os.path.join(asset_dir, "png"), os.path.join(asset_dir, META_FILE),
+             os.path.join(asset_dir, PACK_FILE)]
+    if entry:
+        if entry.get("video"):
+            paths.append(os.path.join(asset_dir, entry["video"]))
+        if entry.get("audio"):
+            paths.append(os.path.join(asset_dir, entry["audio"]))
+    return [_mtime(p) for p in paths]
+
+
+class AssetCatalogue:
+    def __init__(self, root="./memes"):
+        self.root = root
+        self.path = os.path.join(root, CATALOGUE_FILE)
+        self.assets = {}
+        self.detail_ids = []
+        self.detail_mtime = None
+        self.dirty = False
+
+    @classmethod
+    def load(cls, root="./memes", refresh=True):
+        """读取已有索引；refresh 为 True 时增量刷新并在有变化时写回"""
+        catalogue = cls(root)
+        try:
+            with open(catalogue.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get("version") == VERSION:
+                catalogue.assets = data.get("assets", {})
+                catalogue.detail_ids = data.get("detail_ids", [])
+                catalogue.detail_mtime = data.get("detail_mtime")
+        except (OSError, ValueError):
+            catalogue.dirty = True
+        if refresh:
+            catalogue.refresh()
+        return catalogue
+
+    def refresh(self, rebuild=False):
+        """增量刷新：新增/删除的素材目录以及修改时间变化的素材重新读取，返回重新读取的素材数"""
+        if not os.path.isdir(self.root):
+            return 0
+        if rebuild:
+            self.assets = {}
+            self.dirty = True
+
+        detail_path = os.path.join(self.root, DETAIL_FILE)
+        detail_mtime = _mtime(detail_path)
+        if detail_mtime != self.detail_mtime:
+            self.detail_ids = self._read_detail_ids(detail_path)
+            self.detail_mtime = detail_mtime
+            self.dirty = True
+
+        rescanned = 0
+        seen = set()
+        with os.scandir(self.root) as entries:
+            for dir_entry in entries:
+                if not dir_entry.is_dir() or dir_entry.name.startswith('.'):
+                    continue
+                asset_id = dir_entry.name
+                seen.add(asset_id)
+                cached = self.assets.get(asset_id)
+                if cached is not None and cached.get("signature") == asset_signature(dir_entry.path, cached):
+                    continue
+                try:
+                    self.assets[asset_id] = scan_asset(dir_entry.path)
+                except OSError as e:
+                    print(f"素材索引读取失败 {asset_id}: {e}")
+                    continue
+                rescanned += 1
+                self.dirty = True
+
+        for asset_id in set(self.assets) - seen:
+            del self.assets[asset_id]
+            self.dirty = True
+
+        if self.dirty:
+            self.save()
+        return rescanned
+
+    @staticmethod
+    def _read_detail_ids(detail_path):
+        try:
+            with open(detail_path, 'r', encoding='utf-8') as f:
+                return [item['id'] for item in json.load(f) if 'id' in item]
+        except (OSError, ValueError):
+            return []
+
+    def save(self):
+        data = {
+            "version": VERSION,
+            "detail_mtime": self.detail_mtime,
+            "detail_ids": self.detail_ids,
+            "assets": self.assets,
+        }
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+        self.dirty = False
+
+    def get(self, asset_id):
+        """
+        按 id 查询素材条目，不存在时返回 None
+        索引加载后新增的素材目录会在首次查询时补录
+        """
+        entry = self.assets.get(asset_id)
+        if entry is None:
+            asset_dir = self.asset_dir(asset_id)
+            if os.path.isdir(asset_dir):
+                entry = self.assets[asset_id] = scan_asset(asset_dir)
+                self.dirty = True
+        return entry
+
+    def asset_dir(self, asset_id):
+        return os.path.join(self.root, asset_id)
+
+    def png_files(self, asset_id):
+        """PNG 帧文件名列表（按顺序），由索引生成，不列目录"""
+        entry = self.get(asset_id) or {}
+        if "png_files" in entry:
+            return list(entry["png_files"])
+        if "png_format" in entry:
+            return [entry["png_format"].format(i) for i in range(entry["png_count"])]
+        return []
+
+    # ---- 查询 ----
+
+    def usable(self, asset_id):
+        """素材有可渲染的帧（视频、打包帧或 PNG 序列）"""
+        entry = self.get(asset_id)
+        return bool(entry and entry.get("kind"))
+
+    def detail_assets(self):
+        """detail.json 中的素材 id -> 索引条目（没有素材目录时为 None）"""
+        return {asset_id: self.assets.get(asset_id) for asset_id in self.detail_ids}
+
+    def missing_png(self):
+        """detail.json 中没有 png/ 帧序列的素材"""
+        return [a for a, e in self.detail_assets().items() if not (e and e["png_count"])]
+
+    def audio_only(self):
+        """detail.json 中只有音频、没有可渲染帧的素材"""
+        return [a for a, e in self.detail_assets().items() if e and e["audio"] and not e["kind"]]
+
+    def unusable(self):
+        """detail.json 中没有可渲染帧的素材"""
+        return [a for a in self.detail_ids if not self.usable(a)]
+
+    def orphans(self):
+        """有素材目录但不在 detail.json 中的素材"""
+        listed = set(self.detail_ids)
+        return sorted(a for a in self.assets if a not in listed)
+
+    def stats(self):
+        kinds = {}
+        for entry in self.assets.values():
+            kinds[entry["kind"] or "none"] = kinds.get(entry["kind"] or "none", 0) + 1
+        return {
+            "assets": len(self.assets),
+            "detail": len(self.detail_ids),
+            "kinds": kinds,
+            "with_audio": sum(1 for e in self.assets.values() if e["audio"]),
+            "unusable_in_detail": len(self.unusable()),
+            "orphans": len(self.orphans()),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='刷新素材目录索引')
+    parser.add_argument('--root', default='./memes', help='素材根目录')
+    parser.add_argument('--rebuild', action='store_true', help='忽略旧索引全部重建')
+    args = parser.parse_args()
+
+    catalogue = AssetCatalogue.load(args.root, refresh=False)
+    rescanned = catalogue.refresh(rebuild=args.rebuild)
+    print(f"素材索引已更新: {catalogue.path}，重新读取 {rescanned} 个素材")
+    print(json.dumps(catalogue.stats(), ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
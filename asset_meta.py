@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""
+素材元数据 asset_meta.json
+与 png/、frames.pack、audio.wav 放在同一素材目录，由转换工具写入:
+    {"keyed": true,                       输出帧已抠像（带 alpha），渲染时无需再键控
+     "key_profile": {"method": "calibrated", "lower": [h, s, v], "upper": [h, s, v]},
+     "crop": {"x": 0, "y": 0, "width": 0, "height": 0},   内容区域，源视频像素坐标
+     "source_size": [宽, 高], "fps": 源帧率, "frame_count": 帧数,
+     "png_format": "{:04d}.png"}          png/ 下帧文件的命名，序号从 0 开始
+"""
+
+import json
+import os
+import re
+
+META_FILE = "asset_meta.json"
+
+
+def meta_path(asset_dir):
+    return os.path.join(asset_dir, META_FILE)
+
+
+def load_meta(asset_dir):
+    """读取素材元数据，不存在或损坏时返回空字典"""
+    try:
+        with open(meta_path(asset_dir), 'r', encoding='utf-8') as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return meta if isinstance(meta, dict) else {}
+
+
+def sequence_fps(asset_dir, default=60):
+    """
+    帧序列的真实帧率：元数据中记录的帧率优先；
+    其次是 generate_png_audio.py 输出目录名的 _NNfps 后缀；都没有时按渲染器原先假设的 60fps
+    """
+    fps = load_meta(asset_dir).get('fps')
+    if fps:
+        return fps
+    match = re.search(r'_(\d+)fps$', os.path.basename(os.path.normpath(asset_dir)))
+    if match:
+        return int(match.group(1))
+    print(f"警告: {asset_dir} 未记录帧率，按 {default}fps 播放")
+    return default
+
+
+def save_meta(asset_dir, meta):
+    """写临时文件后原子替换"""
+    path = meta_path(asset_dir)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+素材帧打包工具
+将 batch_convert_mp4.py 生成的 png/ 帧序列打包为单个未压缩的 RGBA 文件 (frames.pack)，
+渲染时用 np.memmap 打开，取帧即零拷贝切片，多个渲染进程共享同一份页缓存
+
+文件格式（小端）:
+    头部    magic "CMPK" | 版本 u16 | 标志 u16 | 帧数 u32 | 帧率 f32 | 宽 u32 | 高 u32 | 数据偏移 u64
+    包围盒  帧数 x (x0, y0, x1, y1) int32，每帧 alpha > 0 区域，x1/y1 不含；全透明帧为全 0
+    数据    按 4096 字节对齐，帧数 x 高 x 宽 x 4 的 uint8 RGBA
+"""
+
+import argparse
+import os
+import struct
+import uuid
+
+import numpy as np
+from PIL import Image
+
+from asset_meta import sequence_fps
+from asset_reader import LoopingReader
+
+PACK_FILE = "frames.pack"
+MAGIC = b"CMPK"
+VERSION = 1
+HEADER = struct.Struct("<4sHHIfIIQ")
+ALIGNMENT = 4096
+
+
+def alpha_bbox(alpha):
+    """alpha > 0 区域的包围盒 (x0, y0, x1, y1)，全透明时返回 (0, 0, 0, 0)"""
+    rows = np.flatnonzero(alpha.any(axis=1))
+    if rows.size == 0:
+        return (0, 0, 0, 0)
+    cols = np.flatnonzero(alpha.any(axis=0))
+    return (int(cols[0]), int(rows[0]), int(cols[-1]) + 1, int(rows[-1]) + 1)
+
+
+def build_pack(png_dir, pack_path, fps):
+    """将 png_dir 下的帧按文件名排序打包，写临时文件后原子替换"""
+    files = sorted(f for f in os.listdir(png_dir) if f.endswith('.png'))
+    if not files:
+        raise FileNotFoundError(f"PNG目录为空: {png_dir}")
+
+    with Image.open(os.path.join(png_dir, files[0])) as first:
+        width, height = first.size
+    count = len(files)
+    table_size = count * 4 * 4
+    data_offset = -(-(HEADER.size + table_size) // ALIGNMENT) * ALIGNMENT
+
+    tmp_path = f"{pack_path}.{uuid.uuid4().hex}.tmp"
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, 0, count, float(fps), width, height, data_offset))
+            f.truncate(data_offset + count * height * width * 4)
+
+        data = np.memmap(tmp_path, mode='r+', dtype=np.uint8, offset=data_offset, shape=(count, height, width, 4))
+        bboxes = np.zeros((count, 4), dtype=np.int32)
+        for i, name in enumerate(files):
+            with Image.open(os.path.join(png_dir, name)) as src:
+                img = src.convert("RGBA")
+            if img.size != (width, height):
+                raise ValueError(f"帧尺寸不一致: {name} {img.size} != {(width, height)}")
+            frame = np.asarray(img)
+            data[i] = frame
+            bboxes[i] = alpha_bbox(frame[:, :, 3])
+        data.flush()
+        del data
+
+        with open(tmp_path, 'r+b') as f:
+            f.seek(HEADER.size)
+            f.write(bboxes.astype('<i4').tobytes())
+
+        os.replace(tmp_path, pack_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    return count
+
+
+class PackedAssetReader(LoopingReader):
+    """
+    frames.pack 读取器，接口与 asset_reader 中的读取器一致
+    frame() 返回 memmap 上的只读视图，不做任何解码或拷贝
+    """
+
+    def __init__(self, pack_path, out_fps):
+        self.pack_path = pack_path
+        self.out_fps = out_fps
+        with open(pack_path, 'rb') as f:
+            header = f.read(HEADER.size)
+            magic, version, flags, count, fps, width, height, data_offset = HEADER.unpack(header)
+            if magic != MAGIC or version != VERSION or flags != 0:
+                raise ValueError(f"不支持的素材包格式: {pack_path}")
+            self.bboxes = np.frombuffer(f.read(count * 16), dtype='<i4').reshape(count, 4)
+        self.fps = fps
+        self.size = (width, height)
+        self.frames = np.memmap(pack_path, mode='r', dtype=np.uint8, offset=data_offset,
+                                shape=(count, height, width, 4))
+
+    @property
+    def frame_count(self):
+        return self.frames.shape[0]
+
+    def frame(self, index):
+        return self.frames[index]
+
+    def bbox(self, index):
+        return tuple(int(v) for v in self.bboxes[index])
+
+    @property
+    def nbytes(self):
+        # 页缓存由操作系统管理，不计入进程内存
+        return 0
+
+    def close(self):
+        self.frames = None
+
+
+def pack_asset_dir(asset_dir, fps=None, force=False):
+    """打包单个素材目录，已是最新时跳过；返回打包的帧数，跳过或无 PNG 时返回 0"""
+    png_dir = os.path.join(asset_dir, "png")
+    pack_path = os.path.join(asset_dir, PACK_FILE)
+    if not os.path.isdir(png_dir):
+        return 0
+    if not force and os.path.exists(pack_path) and os.path.getmtime(pack_path) >= os.path.getmtime(png_dir):
+        return 0
+    return build_pack(png_dir, pack_path, fps or sequence_fps(asset_dir))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='将素材PNG帧序列打包为可内存映射的 frames.pack')
+    parser.add_argument('--memes-dir', default='./memes', help='素材根目录')
+    parser.add_argument('--fps', type=float, help='素材帧率，默认取素材元数据或目录名中的帧率，否则按60fps')
+    parser.add_argument('--force', action='store_true', help='强制重新打包')
+    args = parser.parse_args()
+
+    packed = 0
+    for asset_id in sorted(os.listdir(args.memes_dir)):
+        asset_dir = os.path.join(args.memes_dir, asset_id)
+        if not os.path.isdir(asset_dir):
+            continue
+        try:
+            count = pack_asset_dir(asset_dir, args.fps, args.force)
+        except Exception as e:
+            print(f"打包失败: {asset_id}: {e}")
+            continue
+        if count:
+            packed += 1
+            print(f"已打包: {asset_id} ({count} 帧)")
+
+    print(f"\n打包完成，共处理 {packed} 个素材")
+
+
+if __name__ == '__main__':
+    main()
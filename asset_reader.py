@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+"""
+素材帧读取器
+源视频按需顺序解码，已解码的帧放在有字节上限的 LRU 中；
+输出帧到源帧的映射按源/输出帧率预先计算，循环播放不需要 seek，
+绿幕键控只在实际取用的源帧上进行
+"""
+
+import os
+from collections import OrderedDict
+
+import numpy as np
+from PIL import Image
+
+
+def mask_color_alpha(frame, color, thr=20, s=5):
+    """
+    与 moviepy vfx.mask_color 相同的键控算法：
+    按像素到 color 的欧氏距离 d 计算 alpha = d^s / (thr^s + d^s)，thr 为 0 时只剔除完全相同的颜色
+    """
+    diff = frame.astype(np.float32) - np.asarray(color, dtype=np.float32)
+    dist = np.sqrt((diff * diff).sum(axis=2))
+    if thr:
+        dist_s = dist ** s
+        mask = dist_s / (thr ** s + dist_s)
+    else:
+        mask = (dist != 0).astype(np.float32)
+    return (mask * 255 + 0.5).astype(np.uint8)
+
+
+def build_index_map(count, out_fps, source_fps, frame_count):
+    """
+    预计算前 count 个输出帧对应的源帧序号：
+    输出帧时间对源时长取模后换算为源帧序号（循环播放），单帧素材始终为 0
+    """
+    duration = frame_count / source_fps
+    times = np.mod(np.arange(count) / out_fps, duration)
+    indices = (times * source_fps + 1e-5).astype(np.int64)
+    return np.minimum(indices, frame_count - 1)
+
+
+class LoopingReader:
+    """
+    读取器公共部分：输出帧序号 -> 源帧序号的循环映射，按需成倍扩展
+    子类提供 fps（源帧率）、out_fps、frame_count 与 frame(index)
+    """
+
+    _index_map = np.zeros(0, dtype=np.int64)
+
+    def source_indices(self, count):
+        """前 count 个输出帧对应的源帧序号数组（只读视图）"""
+        if count > len(self._index_map):
+            size = max(count, 2 * len(self._index_map), int(self.out_fps * 10))
+            self._index_map = build_index_map(size, self.out_fps, self.fps, self.frame_count)
+        return self._index_map[:count]
+
+    def source_index(self, frame_number):
+        """输出帧序号 -> 源帧序号（循环播放）"""
+        return int(self.source_indices(frame_number + 1)[frame_number])
+
+    def frame_at(self, frame_number):
+        return self.frame(self.source_index(frame_number))
+
+    def bbox(self, index):
+        """源帧 alpha > 0 区域的包围盒 (x0, y0, x1, y1)，读取器没有预先算好时返回 None"""
+        return None
+
+
+def decode_spec(fg):
+    """前景的解码参数 (键控颜色, 阈值, 陡度)，不键控时颜色为 None"""
+    if 'mask_color' not in fg:
+        return (None, 0, 0)
+    return (tuple(fg['mask_color']), fg.get('mask_thr', 20), fg.get('mask_s', 5))
+
+
+class VideoAssetReader(LoopingReader):
+    """
+    按需顺序解码一个素材视频，输出 RGBA (RGB 顺序) 帧
+    已解码的帧放在按字节预算淘汰的 LRU 中（cache_mb），整段素材放得下时每个源帧只解码一次；
+    请求的帧在当前解码位置之前且不在缓存中时重新从头解码（循环播放时每轮一次）
+    mask_color 优先；否则 key_range（素材校准的 HSV 范围）不为 None 时按该范围抠绿幕；两者都没有时 alpha 恒为 255
+    """
+
+    def __init__(self, path, out_fps, mask_color=None, mask_thr=20, mask_s=5, key_range=None, cache_mb=64):
+        self.path = path
+        self.out_fps = out_fps
+        self.mask_color = mask_color
+        self.mask_thr = mask_thr
+        self.mask_s = mask_s
+        self.keyer = None
+        if mask_color is None and key_range is not None:
+            from chroma_key import ChromaKeyer
+            self.keyer = ChromaKeyer(lower=key_range[:3], upper=key_range[3:])
+        self.cache_bytes = int(cache_mb * 1024 * 1024)
+        self.frames = OrderedDict()  # 源帧序号 -> RGBA 帧
+        self._stream = None
+        self._next_index = 0
+        self._frame_count = None
+        self.fps = None
+        self.size = None
+        self._open_stream()
+        if self._frame_count is None:
+            raise ValueError(f"无法从视频中解码帧: {self.path}")
+
+    def _open_stream(self):
+        import imageio_ffmpeg
+
+        if self._stream is not None:
+            self._stream.close()
+        self._stream = imageio_ffmpeg.read_frames(self.path, pix_fmt='rgb24')
+        self._next_index = 0
+        meta = next(self._stream)
+        self.fps = meta.get('fps') or self.out_fps
+        self.size = tuple(meta['size'])
+        if self._frame_count is None:
+            # 只解析封装、不解码像素，得到准确的帧数
+            self._frame_count = imageio_ffmpeg.count_frames_and_secs(self.path)[0] or None
+
+    def _key(self, raw):
+        width, height = self.size
+        rgb = np.frombuffer(raw, dtype=np.uint8).reshape(height, width, 3)
+        rgba = np.empty((height, width, 4), dtype=np.uint8)
+        rgba[:, :, :3] = rgb
+        if self.mask_color is not None:
+            try:
+                rgba[:, :, 3] = mask_color_alpha(rgb, self.mask_color, self.mask_thr, self.mask_s)
+            except Exception as e:
+                print(f"绿幕处理失败 for {self.path}: {e}")
+                self.mask_color = None
+                rgba[:, :, 3] = 255
+        elif self.keyer is not None:
+            # ChromaKeyer 按 BGR 顺序计算
+            rgba[:, :, 3] = self.keyer.alpha(np.ascontiguousarray(rgb[:, :, ::-1]))
+        else:
+            rgba[:, :, 3] = 255
+        return rgba
+
+    @property
+    def frame_count(self):
+        return self._frame_count
+
+    @property
+    def duration(self):
+        return self.frame_count / self.fps
+
+    def frame(self, index):
+        rgba = self.frames.get(index)
+        if rgba is not None:
+            self.frames.move_to_end(index)
+            return rgba
+
+        if index < self._next_index:
+            self._open_stream()
+        raw = None
+        # 跳过的帧只解码不抠像
+        while self._next_index <= index:
+            raw = next(self._stream, None)
+            if raw is None:
+                raise IndexError(f"视频帧 {index} 超出范围: {self.path}")
+            self._next_index += 1
+        rgba = self._key(raw)
+
+        self.frames[index] = rgba
+        while len(self.frames) > 1 and self.nbytes > self.cache_bytes:
+            self.frames.popitem(last=False)
+        return rgba
+
+    @property
+    def nbytes(self):
+        width, height = self.size
+        return len(self.frames) * width * height * 4
+
+    def close(self):
+        self.frames.clear()
+        if self._stream is not None:
+            self._stream.close()
+            self._stream = None
+
+
+class PngSequenceReader(LoopingReader):
+    """
+    PNG 帧序列读取器，按文件名顺序为源帧序号，按素材真实帧率循环播放
+    fps 来自素材元数据或目录名（见 asset_catalogue），旧素材未记录时按 60fps
+    files 由素材索引提供时不再列目录
+    """
+
+    def __init__(self, png_dir, out_fps, fps=60, files=None):
+        self.png_dir = png_dir
+        self.out_fps = out_fps
+        self.fps = fps
+        self.files = files or sorted(f for f in os.listdir(png_dir) if f.endswith('.png'))
+        if not self.files:
+            raise FileNotFoundError(f"素材帧缺失: {png_dir}")
+
+    @property
+    def frame_count(self):
+        return len(self.files)
+
+    def frame(self, index):
+        return np.asarray(Image.open(os.path.join(self.png_dir, self.files[index])).convert("RGBA"))
+
+    @property
+    def nbytes(self):
+        return 0
+
+    def close(self):
+        pass
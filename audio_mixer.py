@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""
+NumPy 音频混合
+每个素材的 audio.wav 只解析一次，以 int16 PCM 数组缓存；
+混音时把各段音频按增益累加到一块预分配的 float32 缓冲，最后统一限幅，
+再分块写出 WAV，避免 pydub overlay 每次复制整条时间轴
+"""
+
+import os
+import wave
+
+import numpy as np
+
+SAMPLE_RATE = 44100
+CHANNELS = 2
+
+
+class PcmCache:
+    """音频文件 -> int16 PCM 数组 (采样数, 声道数)，统一为目标采样率与声道数"""
+
+    def __init__(self, sample_rate=SAMPLE_RATE, channels=CHANNELS):
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self._pcm = {}
+        self.hits = 0
+        self.misses = 0
+
+    def load(self, path):
+        mtime = os.path.getmtime(path)
+        cached = self._pcm.get(path)
+        if cached is not None and cached[0] == mtime:
+            self.hits += 1
+            return cached[1]
+
+        self.misses += 1
+        pcm = self._read_wav(path)
+        if pcm is None:
+            pcm = self._read_with_pydub(path)
+        self._pcm[path] = (mtime, pcm)
+        return pcm
+
+    def _read_wav(self, path):
+        # 常见情况：16 位 PCM 且采样率、声道数已符合要求，直接读取
+        try:
+            with wave.open(path, 'rb') as wf:
+                if (wf.getsampwidth() != 2 or wf.getframerate() != self.sample_rate
+                        or wf.getnchannels() != self.channels):
+                    return None
+                data = wf.readframes(wf.getnframes())
+        except (wave.Error, EOFError):
+            return None
+        return np.frombuffer(data, dtype='<i2').reshape(-1, self.channels)
+
+    def _read_with_pydub(self, path):
+        # 其余格式交给 pydub 转换一次
+        from pydub import AudioSegment
+
+        audio = AudioSegment.from_file(path)
+        audio = audio.set_frame_rate(self.sample_rate).set_channels(self.channels).set_sample_width(2)
+        return np.frombuffer(audio.raw_data, dtype='<i2').reshape(-1, self.channels)
+
+    def clear(self):
+        self._pcm.clear()
+
+
+class AudioMixer:
+    """在固定长度的 float32 缓冲上叠加多段 PCM"""
+
+    def __init__(self, duration, sample_rate=SAMPLE_RATE, channels=CHANNELS):
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.buffer = np.zeros((int(round(duration * sample_rate)), channels), dtype=np.float32)
+        self.clip_count = 0
+
+    def add(self, pcm, start, max_duration=None, gain=1.0):
+        """
+        在 start 秒处叠加一段 PCM，超过 max_duration 秒或时间轴末尾的部分截断
+        返回实际叠加的采样数
+        """
+        offset = int(round(start * self.sample_rate))
+        length = len(pcm)
+        if max_duration is not None:
+            length = min(length, int(max_duration * self.sample_rate))
+        length = min(length, len(self.buffer) - offset)
+        if length <= 0:
+            return 0
+
+        target = self.buffer[offset:offset + length]
+        if gain == 1.0:
+            target += pcm[:length]
+        else:
+            target += pcm[:length].astype(np.float32) * gain
+        self.clip_count += 1
+        return length
+
+    def write_wav(self, path, chunk_seconds=5):
+        """限幅为 int16 后分块写出，不额外复制整条时间轴"""
+        chunk = int(chunk_seconds * self.sample_rate)
+        with wave.open(path, 'wb') as wf:
+            wf.setnchannels(self.channels)
+            wf.setsampwidth(2)
+            wf.setframerate(self.sample_rate)
+            for start in range(0, len(self.buffer), chunk):
+                block = np.clip(self.buffer[start:start + chunk], -32768, 32767)
+                wf.writeframes(block.astype('<i2').tobytes())
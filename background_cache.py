@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+背景图片磁盘缓存
+以 (搜索词, 分辨率) 的哈希为键，保存已缩放好的 BGR 帧 (.npy)，
+index.json 记录每个条目的大小与访问时间，支持按 TTL 与总大小淘汰；
+数据与索引均先写临时文件再原子替换，索引更新加文件锁，多个任务可共享同一目录
+"""
+
+import hashlib
+import json
+import os
+import time
+import uuid
+from contextlib import contextmanager
+
+import numpy as np
+
+
+class DiskBackgroundCache:
+    INDEX_FILE = "index.json"
+    LOCK_FILE = "index.lock"
+    # 持锁进程崩溃后遗留的锁文件，超过该秒数视为失效；须短于 _locked 的等待时间，等待中才能回收
+    # 持锁期间只读写一次索引，正常持锁时间远小于该值
+    STALE_LOCK_SECONDS = 5
+
+    def __init__(self, root="cache/backgrounds", ttl_hours=24 * 30, max_mb=2048):
+        self.root = root
+        self.ttl_seconds = ttl_hours * 3600
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.root, exist_ok=True)
+
+    @staticmethod
+    def make_key(query, resolution):
+        raw = f"{query}|{resolution[0]}x{resolution[1]}"
+        return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+    def _path(self, name):
+        return os.path.join(self.root, name)
+
+    @contextmanager
+    def _locked(self, timeout=10):
+        lock_path = self._path(self.LOCK_FILE)
+        deadline = time.time() + timeout
+        while True:
+            try:
+                fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                break
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(lock_path) > self.STALE_LOCK_SECONDS:
+                        os.remove(lock_path)
+                        continue
+                except FileNotFoundError:
+                    continue
+                if time.time() > deadline:
+                    raise TimeoutError(f"等待背景缓存索引锁超时: {lock_path}")
+                time.sleep(0.05)
+        try:
+            yield
+        finally:
+            os.close(fd)
+            try:
+                os.remove(lock_path)
+            except FileNotFoundError:
+                pass
+
+    def _read_index(self):
+        try:
+            with open(self._path(self.INDEX_FILE), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _write_index(self, index):
+        tmp_path = self._path(f".index-{uuid.uuid4().hex}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(index, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self._path(self.INDEX_FILE))
+
+    def contains(self, query, resolution):
+        """是否有未过期的条目，不读取数据、不更新访问时间"""
+        entry = self._read_index().get(self.make_key(query, resolution))
+        return (entry is not None and time.time() - entry['created'] <= self.ttl_seconds
+                and os.path.exists(self._path(entry['file'])))
+
+    def get(self, query, resolution):
+        """命中返回 HxWx3 BGR 数组，未命中、过期或文件损坏返回 None"""
+        key = self.make_key(query, resolution)
+        entry = self._read_index().get(key)
+        if entry is None or time.time() - entry['created'] > self.ttl_seconds:
+            self.misses += 1
+            return None
+
+        try:
+            img = np.load(self._path(entry['file']))
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        if img.shape != (resolution[1], resolution[0], 3):
+            self.misses += 1
+            return None
+
+        # 访问时间只影响淘汰顺序，锁被占用时不等待，跳过本次更新
+        try:
+            with self._locked(timeout=0):
+                index = self._read_index()
+                if key in index:
+                    index[key]['last_access'] = time.time()
+                    self._write_index(index)
+        except TimeoutError:
+            pass
+        self.hits += 1
+        return img
+
+    def put(self, query, resolution, img):
+        key = self.make_key(query, resolution)
+        file_name = f"{key}.npy"
+
+        # 先写临时文件再原子替换，读者永远看不到写了一半的数据
+        tmp_path = self._path(f".{key}-{uuid.uuid4().hex}.tmp")
+        with open(tmp_path, 'wb') as f:
+            np.save(f, np.ascontiguousarray(img))
+        os.replace(tmp_path, self._path(file_name))
+
+        now = time.time()
+        with self._locked():
+            index = self._read_index()
+            index[key] = {
+                'query': query,
+                'resolution': list(resolution),
+                'file': file_name,
+                'bytes': os.path.getsize(self._path(file_name)),
+                'created': now,
+                'last_access': now,
+            }
+            self._evict(index, now)
+            self._write_index(index)
+
+    def _evict(self, index, now):
+        # 先淘汰过期条目，再按最久未访问淘汰直到总大小低于上限
+        expired = [k for k, e in index.items() if now - e['created'] > self.ttl_seconds]
+        for key in expired:
+            self._remove(index.pop(key))
+
+        total = sum(e['bytes'] for e in index.values())
+        for key in sorted(index, key=lambda k: index[k]['last_access']):
+            if total <= self.max_bytes:
+                break
+            entry = index.pop(key)
+            total -= entry['bytes']
+            self._remove(entry)
+
+    def _remove(self, entry):
+        try:
+            os.remove(self._path(entry['file']))
+        except FileNotFoundError:
+            pass
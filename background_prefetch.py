@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""
+背景图片下载与预取
+渲染开始前收集剧本中所有不重复的背景搜索词，用线程池并发下载，
+下载完成的图片交给另一个线程池解码、缩放，渲染循环不再等待网络；
+连接池、限速与重试由 api_client 统一处理
+"""
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from api_client import get_client
+
+
+class BackgroundFetcher:
+    """
+    Pexels 搜索并下载背景原图，返回图片字节
+    请求经进程内共享的 api_client 客户端发出（连接池、按主机限速、429/5xx 退避重试）；
+    api_url 可指向本地替身服务器，图片地址取自搜索结果，同样可由替身服务器提供
+    """
+
+    def __init__(self, api_key, api_url, pool_size=8):
+        self.api_key = api_key
+        self.api_url = api_url
+        self.client = get_client("pexels", pool_size=pool_size)
+
+    def fetch_once(self, query):
+        headers = {"Authorization": self.api_key}
+        url = f"{self.api_url}?query={query}&per_page=1&orientation=portrait"
+        response = self.client.get(url, headers=headers, timeout=10)
+        response.raise_for_status()
+        data = response.json()
+        if not data.get("photos"):
+            raise Exception(f"未找到相关图片: {query}")
+        # 获取质量最佳的图片
+        photo_url = data["photos"][0]["src"]["original"]
+        response = self.client.get(photo_url, timeout=15)
+        response.raise_for_status()
+        return response.content
+
+    def fetch(self, query):
+        """下载 query 的背景原图字节，失败（客户端重试用尽或不可重试的错误）时返回 None"""
+        if not self.api_key:
+            raise ValueError("需要Pexels API密钥")
+        print(f"[开始下载] 背景图片: {query}")
+        try:
+            content = self.fetch_once(query)
+        except Exception as e:
+            print(f"[下载失败] {query}: {str(e)}")
+            print(f"[警告] 使用黑色背景替代: {query}")
+            return None
+        print(f"[下载成功] 背景图片: {query}")
+        return content
+
+
+def prefetch(queries, fetch, process, fetch_workers=8, process_workers=2):
+    """
+    并发下载 queries，每张下载完成后立即交给处理线程池执行 process(query, content)
+    返回 (成功的搜索词列表, 失败的搜索词列表)
+    """
+    done, failed = [], []
+    if not queries:
+        return done, failed
+    with ThreadPoolExecutor(max_workers=max(1, fetch_workers)) as fetch_pool, \
+            ThreadPoolExecutor(max_workers=max(1, process_workers)) as process_pool:
+        fetches = {fetch_pool.submit(fetch, query): query for query in queries}
+        processing = {}
+        for future in as_completed(fetches):
+            query = fetches[future]
+            try:
+                content = future.result()
+            except Exception as e:
+                print(f"[背景预取] 下载失败 {query}: {str(e)}")
+                content = None
+            if content is None:
+                failed.append(query)
+                continue
+            processing[process_pool.submit(process, query, content)] = query
+        for future in as_completed(processing):
+            query = processing[future]
+            try:
+                future.result()
+                done.append(query)
+            except Exception as e:
+                print(f"[背景预取] 图片处理失败 {query}: {str(e)}")
+                failed.append(query)
+    return done, failed
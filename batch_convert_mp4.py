@@ -13,56 +13,140 @@ import argparse
 from pathlib import Path
 import subprocess
 import re
+import hashlib
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
-def remove_green_background(frame, threshold=50):
+from asset_meta import load_meta, save_meta
+from chroma_key import (
+    GREEN_LOWER, GREEN_UPPER, ChromaKeyer, IncrementalKeyer, calibrate_key_range,
+    iter_frame_chunks, key_profile, profile_key_range
+)
+
+# 转换清单：记录每个素材的源文件指纹与输出，用于断点续跑
+MANIFEST_FILE = '.convert_manifest.json'
+# 转换中的临时输出目录后缀，完成后整体改名为正式目录
+PARTIAL_SUFFIX = '.partial-'
+# 每次抠像处理的帧数
+KEY_CHUNK_SIZE = 16
+# 校准键控颜色时采样的帧数
+CALIBRATION_FRAMES = 8
+
+_keyer = ChromaKeyer()
+
+def make_keyer(key_tolerance=None, base=_keyer):
     """
-    移除绿幕背景
+    key_tolerance 为 None 时逐帧完整抠像，否则只重抠与上次相比变化超过该值的图块
     """
-    # 转换为HSV色彩空间
-    hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
-    
-    # 定义绿色范围
-    lower_green = np.array([40, 40, 40])
-    upper_green = np.array([80, 255, 255])
-    
-    # 创建绿色掩码
-    mask = cv2.inRange(hsv, lower_green, upper_green)
-    
-    # 形态学操作，去除噪声
-    kernel = np.ones((3, 3), np.uint8)
-    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel)
-    mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel)
-    
-    # 创建RGBA图像
-    rgba_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGBA)
-    
-    # 将绿色区域设为透明
-    rgba_frame[:, :, 3] = 255 - mask
-    
-    return rgba_frame
+    if key_tolerance is None:
+        return base
+    return IncrementalKeyer(base, tolerance=key_tolerance)
+
+def sample_video_frames(video_path, count=CALIBRATION_FRAMES):
+    """
+    在整段视频中均匀取 count 帧 (BGR)
+    """
+    cap = cv2.VideoCapture(video_path)
+    try:
+        total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        positions = np.linspace(0, max(0, total - 1), num=max(1, min(count, total))).astype(int)
+        frames = []
+        for pos in positions:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, int(pos))
+            ret, frame = cap.read()
+            if ret:
+                frames.append(frame)
+        return frames
+    finally:
+        cap.release()
+
+def calibrate_video_key(video_path):
+    """
+    从多帧边框校准幕布颜色，得到素材的键控参数；校准失败时使用固定绿幕阈值
+    """
+    key_range = calibrate_key_range(sample_video_frames(video_path))
+    if key_range is None:
+        print("警告: 键控颜色校准失败，使用固定绿幕阈值")
+        return key_profile(GREEN_LOWER + GREEN_UPPER, "fixed")
+    return key_profile(key_range, "calibrated")
+
+def merge_content_bounds(bounds, opaque):
+    """
+    将一帧的非透明区域并入累计边界 (min_x, min_y, max_x, max_y)
+    opaque 为布尔掩码；该帧全透明时原样返回
+    """
+    rows = np.flatnonzero(opaque.any(axis=1))
+    if rows.size == 0:
+        return bounds
+    cols = np.flatnonzero(opaque.any(axis=0))
+    frame_bounds = (int(cols[0]), int(rows[0]), int(cols[-1]), int(rows[-1]))
+    if bounds is None:
+        return frame_bounds
+    return (
+        min(bounds[0], frame_bounds[0]), min(bounds[1], frame_bounds[1]),
+        max(bounds[2], frame_bounds[2]), max(bounds[3], frame_bounds[3])
+    )
+
+def iter_video_frames(video_path):
+    """
+    逐帧读取视频 (BGR)，读完或中途退出时释放解码器
+    """
+    cap = cv2.VideoCapture(video_path)
+    try:
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            yield frame
+    finally:
+        cap.release()
+
+def scan_content_bounds(video_path, keyer=_keyer):
+    """
+    第一遍：只计算抠像掩码，累计所有帧的内容边界
+    返回 (帧数, 边界)，全部透明时边界为 None
+    """
+    bounds = None
+    count = 0
+    for _, chunk in iter_frame_chunks(iter_video_frames(video_path), KEY_CHUNK_SIZE):
+        for mask in keyer.mask(chunk):
+            bounds = merge_content_bounds(bounds, mask < 255)
+        count += len(chunk)
+    return count, bounds
 
-def find_content_bounds(frames):
+def iter_processed_frames(video_path, bounds, target_size=512, keyer=_keyer):
+    """
+    第二遍：重新解码，按块抠像、裁剪到内容区域并居中缩放到 target_size 的透明画布
     """
-    找到所有帧中内容的边界
+    min_x, min_y, max_x, max_y = bounds
+    rgba_chunk = None
+    for _, chunk in iter_frame_chunks(iter_video_frames(video_path), KEY_CHUNK_SIZE):
+        if rgba_chunk is None:
+            rgba_chunk = np.empty(chunk.shape[:-1] + (4,), np.uint8)
+        for rgba_frame in keyer.key(chunk, out=rgba_chunk[:len(chunk)]):
+            # 裁剪到内容区域
+            yield _fit_to_canvas(rgba_frame[min_y:max_y+1, min_x:max_x+1], target_size)
+
+def _fit_to_canvas(cropped, target_size):
     """
-    min_x, min_y = float('inf'), float('inf')
-    max_x, max_y = 0, 0
+    保持宽高比缩放并居中放到 target_size 的透明画布
+    """
+    h, w = cropped.shape[:2]
+    scale = min(target_size / w, target_size / h)
+    new_w, new_h = int(w * scale), int(h * scale)
     
-    for frame in frames:
-        # 找到非透明像素
-        alpha = frame[:, :, 3]
-        coords = np.where(alpha > 0)
-        
-        if len(coords[0]) > 0:
-            y_min, y_max = coords[0].min(), coords[0].max()
-            x_min, x_max = coords[1].min(), coords[1].max()
-            
-            min_x = min(min_x, x_min)
-            min_y = min(min_y, y_min)
-            max_x = max(max_x, x_max)
-            max_y = max(max_y, y_max)
+    # 缩放
+    resized = cv2.resize(cropped, (new_w, new_h), interpolation=cv2.INTER_AREA)
     
-    return int(min_x), int(min_y), int(max_x), int(max_y)
+    # 创建目标尺寸的透明画布
+    canvas = np.zeros((target_size, target_size, 4), dtype=np.uint8)
+    
+    # 居中放置
+    start_y = (target_size - new_h) // 2
+    start_x = (target_size - new_w) // 2
+    canvas[start_y:start_y+new_h, start_x:start_x+new_w] = resized
+    return canvas
 
 def extract_audio(video_path, output_path):
     """
@@ -104,9 +188,12 @@ def extract_audio(video_path, output_path):
         print(f"音频提取异常: {e}")
         return False
 
-def process_video(video_path, output_dir, asset_id):
+def process_video(video_path, output_dir, asset_id, pack=False, key_tolerance=None, profile=None):
     """
     处理单个视频文件
+    pack 为 True 时额外生成可内存映射的 frames.pack
+    key_tolerance 不为 None 时使用增量抠像，适合固定机位素材
+    profile 为已有的键控参数（见 asset_meta），为 None 时从视频校准
     """
     # 确保路径编码正确
     try:
@@ -131,65 +218,43 @@ def process_video(video_path, output_dir, asset_id):
             temp_dir = tempfile.mkdtemp()
             temp_video = os.path.join(temp_dir, f"temp_{asset_id}.mp4")
             shutil.copy2(video_path_safe, temp_video)
-            cap = cv2.VideoCapture(temp_video)
+            decode_path = temp_video
         else:
-            cap = cv2.VideoCapture(video_path_safe)
+            decode_path = video_path_safe
+        cap = cv2.VideoCapture(decode_path)
+        source_fps = cap.get(cv2.CAP_PROP_FPS) or 30
+        source_size = [int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))]
+        cap.release()
     except Exception as e:
         print(f"无法打开视频文件: {e}")
         return False
     
-    frames = []
-    
-    # 提取所有帧
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
-        
-        # 移除绿幕背景
-        rgba_frame = remove_green_background(frame)
-        frames.append(rgba_frame)
+    # 键控参数每个素材只校准一次，结果写入 asset_meta.json 供重新转换与渲染时使用
+    if profile is None:
+        profile = calibrate_video_key(decode_path)
+    key_range = profile_key_range(profile)
+    print(f"键控范围 ({profile['method']}): {profile['lower']} - {profile['upper']}")
+    keyer = ChromaKeyer(lower=key_range[:3], upper=key_range[3:])
     
-    cap.release()
+    # 分两遍流式处理，内存中只保留当前帧：
+    # 第一遍只算掩码得到全片内容边界，第二遍重新解码、抠像、裁剪并逐帧写出
+    frame_count, bounds = scan_content_bounds(decode_path, make_keyer(key_tolerance, keyer))
     
-    if not frames:
+    if frame_count == 0:
         print(f"警告: 无法从 {video_path_safe} 提取帧")
         return False
-    
-    # 找到内容边界
-    min_x, min_y, max_x, max_y = find_content_bounds(frames)
-    
-    # 裁剪并缩放帧
-    target_size = 512  # 目标尺寸
-    processed_frames = []
-    
-    for frame in frames:
-        # 裁剪到内容区域
-        cropped = frame[min_y:max_y+1, min_x:max_x+1]
-        
-        # 计算缩放比例，保持宽高比
-        h, w = cropped.shape[:2]
-        scale = min(target_size / w, target_size / h)
-        new_w, new_h = int(w * scale), int(h * scale)
-        
-        # 缩放
-        resized = cv2.resize(cropped, (new_w, new_h), interpolation=cv2.INTER_AREA)
-        
-        # 创建目标尺寸的透明画布
-        canvas = np.zeros((target_size, target_size, 4), dtype=np.uint8)
-        
-        # 居中放置
-        start_y = (target_size - new_h) // 2
-        start_x = (target_size - new_w) // 2
-        canvas[start_y:start_y+new_h, start_x:start_x+new_w] = resized
-        
-        processed_frames.append(canvas)
+    if bounds is None:
+        print(f"警告: {asset_id} 所有帧均为绿幕，保留完整画面")
+        height, width = next(iter_video_frames(decode_path)).shape[:2]
+        bounds = (0, 0, width - 1, height - 1)
     
     # 保存PNG帧序列到png子目录
     png_dir = os.path.join(asset_output_dir, "png")
     os.makedirs(png_dir, exist_ok=True)
     
-    for i, frame in enumerate(processed_frames):
+    written = 0
+    for i, frame in enumerate(iter_processed_frames(decode_path, bounds, keyer=make_keyer(key_tolerance, keyer))):
+        written += 1
         output_path = os.path.join(png_dir, f"{i:04d}.png")
         # 使用PIL保存RGBA格式的PNG
         try:
@@ -203,6 +268,9 @@ def process_video(video_path, output_dir, asset_id):
         except Exception as e:
             print(f"警告: 保存帧 {i} 失败: {output_path}, 错误: {e}")
     
+    if written != frame_count:
+        print(f"警告: 两遍解码帧数不一致 ({frame_count} / {written})")
+    
     # 验证PNG文件是否真的被创建
     png_files = [f for f in os.listdir(png_dir) if f.endswith('.png')]
     print(f"PNG目录中实际文件数: {len(png_files)}")
@@ -211,10 +279,31 @@ def process_video(video_path, output_dir, asset_id):
         print(f"目录是否存在: {os.path.exists(png_dir)}")
         print(f"目录权限: {os.access(png_dir, os.W_OK)}")
     
+    # 记录键控参数与裁切区域，输出帧已带 alpha，渲染时不再键控
+    min_x, min_y, max_x, max_y = bounds
+    save_meta(asset_output_dir, {
+        "keyed": True,
+        "key_profile": profile,
+        "crop": {"x": min_x, "y": min_y, "width": max_x - min_x + 1, "height": max_y - min_y + 1},
+        "source_size": source_size,
+        "fps": source_fps,
+        "frame_count": written,
+        "png_format": "{:04d}.png",
+    })
+    
+    # 打包帧序列，记录真实帧率
+    if pack and png_files:
+        try:
+            from asset_pack import PACK_FILE, build_pack
+            build_pack(png_dir, os.path.join(asset_output_dir, PACK_FILE), source_fps)
+            print(f"帧序列已打包: {PACK_FILE} ({source_fps:.2f}fps)")
+        except Exception as e:
+            print(f"警告: 帧序列打包失败: {e}")
+    
     # 提取音频
     audio_path = os.path.join(asset_output_dir, "audio.wav")
     # 使用安全的路径进行音频提取
-    audio_source = temp_video if (os.name == 'nt' and 'temp_video' in locals()) else video_path_safe
+    audio_source = decode_path
     if extract_audio(audio_source, audio_path):
         print(f"音频提取成功: {asset_id}")
     else:
@@ -230,15 +319,151 @@ def process_video(video_path, output_dir, asset_id):
         except:
             pass
     
-    print(f"完成处理: {asset_id}, 生成 {len(processed_frames)} 帧")
+    print(f"完成处理: {asset_id}, 生成 {written} 帧")
     return True
 
+def file_sha256(path, chunk_size=1 << 20):
+    """
+    流式计算文件的 sha256
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def source_fingerprint(video_path, previous=None):
+    """
+    源文件指纹 (大小, 修改时间, sha256)
+    大小与修改时间都未变时沿用清单中的哈希，避免每次重新读取整个视频
+    """
+    stat = os.stat(video_path)
+    fingerprint = {'size': stat.st_size, 'mtime': stat.st_mtime}
+    if previous and previous.get('size') == stat.st_size and previous.get('mtime') == stat.st_mtime:
+        fingerprint['sha256'] = previous.get('sha256')
+    else:
+        fingerprint['sha256'] = file_sha256(video_path)
+    return fingerprint
+
+def load_manifest(output_dir):
+    try:
+        with open(os.path.join(output_dir, MANIFEST_FILE), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+def save_manifest(output_dir, manifest):
+    """
+    先写临时文件再原子替换，中断时不会留下损坏的清单
+    """
+    manifest_path = os.path.join(output_dir, MANIFEST_FILE)
+    tmp_path = f"{manifest_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, manifest_path)
+
+def describe_outputs(asset_output_dir):
+    """
+    统计素材目录中的输出，用于判断输出是否完整
+    """
+    png_dir = os.path.join(asset_output_dir, 'png')
+    png_count = len([f for f in os.listdir(png_dir) if f.endswith('.png')]) if os.path.isdir(png_dir) else 0
+    return {
+        'png_count': png_count,
+        'audio': os.path.exists(os.path.join(asset_output_dir, 'audio.wav')),
+        'pack': os.path.exists(os.path.join(asset_output_dir, 'frames.pack')),
+    }
+
+def is_up_to_date(entry, fingerprint, asset_output_dir):
+    """
+    源文件内容未变且输出与清单记录一致时视为已完成
+    """
+    if not entry or entry.get('sha256') != fingerprint['sha256']:
+        return False
+    if not os.path.isdir(asset_output_dir):
+        return False
+    outputs = describe_outputs(asset_output_dir)
+    return outputs['png_count'] > 0 and outputs['png_count'] == entry.get('outputs', {}).get('png_count')
+
+def clean_partial_outputs(output_dir):
+    """
+    删除上次中断遗留的临时输出目录
+    """
+    for name in os.listdir(output_dir):
+        if PARTIAL_SUFFIX in name and os.path.isdir(os.path.join(output_dir, name)):
+            print(f"清理未完成的输出: {name}")
+            shutil.rmtree(os.path.join(output_dir, name), ignore_errors=True)
+
+def install_outputs(partial_dir, asset_output_dir):
+    """
+    将临时目录中本次生成的 png/ 与文件逐个换入素材目录，
+    素材目录中其他文件（另行生成的音频等）保持不变
+    """
+    os.makedirs(asset_output_dir, exist_ok=True)
+    for name in os.listdir(partial_dir):
+        src = os.path.join(partial_dir, name)
+        dst = os.path.join(asset_output_dir, name)
+        if os.path.isdir(src):
+            # 旧目录先移开再换入新目录，两次 rename 之间旧输出仍可恢复
+            old_dir = os.path.join(asset_output_dir, f".{name}.old-{os.getpid()}")
+            if os.path.exists(old_dir):
+                shutil.rmtree(old_dir)
+            if os.path.exists(dst):
+                os.replace(dst, old_dir)
+            os.replace(src, dst)
+            shutil.rmtree(old_dir, ignore_errors=True)
+        else:
+            os.replace(src, dst)
+    shutil.rmtree(partial_dir, ignore_errors=True)
+
+def convert_asset(video_path, asset_output_dir, asset_id, pack=False, key_tolerance=None, key_mode="auto"):
+    """
+    先转换到输出目录下以 . 开头的临时目录（素材索引不会扫描到），成功后只把本次生成的
+    png/、asset_meta.json、audio.wav、frames.pack 换入素材目录，中断或失败时不会留下不完整的 png/ 目录
+    素材目录中已有 frames.pack 时一并重新打包，避免留下与新帧不一致的旧包
+    key_mode: auto 沿用已有的键控参数，没有时校准；recalibrate 重新校准；fixed 使用固定绿幕阈值
+    返回 (asset_id, 是否成功, 输出统计)
+    """
+    from asset_pack import PACK_FILE
+    
+    output_dir, name = os.path.split(os.path.normpath(asset_output_dir))
+    partial_dir = os.path.join(output_dir, f".{name}{PARTIAL_SUFFIX}{os.getpid()}")
+    if os.path.exists(partial_dir):
+        shutil.rmtree(partial_dir)
+    pack = pack or os.path.exists(os.path.join(asset_output_dir, PACK_FILE))
+    
+    try:
+        if key_mode == "fixed":
+            profile = key_profile(GREEN_LOWER + GREEN_UPPER, "fixed")
+        elif key_mode == "auto":
+            profile = load_meta(asset_output_dir).get('key_profile')
+        else:
+            profile = None
+        ok = process_video(video_path, partial_dir, asset_id, pack=pack, key_tolerance=key_tolerance, profile=profile)
+        outputs = describe_outputs(partial_dir) if ok else None
+        if not ok or outputs['png_count'] == 0:
+            shutil.rmtree(partial_dir, ignore_errors=True)
+            return asset_id, False, None
+        
+        install_outputs(partial_dir, asset_output_dir)
+        return asset_id, True, describe_outputs(asset_output_dir)
+    except Exception as e:
+        print(f"转换异常: {asset_id}: {e}")
+        shutil.rmtree(partial_dir, ignore_errors=True)
+        return asset_id, False, None
+
 def main():
     parser = argparse.ArgumentParser(description='批量转换MP4绿幕素材为PNG帧序列')
     parser.add_argument('--input-dir', default='./memes/猫meme小剧场', help='输入目录路径')
     parser.add_argument('--output-dir', default='./memes', help='输出目录路径')
     parser.add_argument('--force', action='store_true', help='强制重新处理已存在的素材')
     parser.add_argument('--use-mapping', action='store_true', help='使用素材名称映射')
+    parser.add_argument('--pack', action='store_true', help='同时生成可内存映射的 frames.pack')
+    parser.add_argument('--jobs', type=int, default=1, help='并行转换的进程数')
+    parser.add_argument('--key-tolerance', type=int, default=None,
+                        help='启用增量抠像：只重抠像素变化超过该值的图块（固定机位素材建议 8，0 为无损）')
+    parser.add_argument('--key-mode', choices=['auto', 'recalibrate', 'fixed'], default='auto',
+                        help='键控颜色：auto 沿用素材已校准的参数（没有则校准），recalibrate 重新校准，fixed 固定绿幕阈值')
     
     args = parser.parse_args()
     
@@ -264,6 +489,9 @@ def main():
         mapping = {}
     
     processed_count = 0
+    clean_partial_outputs(output_dir)
+    manifest = load_manifest(output_dir)
+    tasks = []
     
     # 遍历所有分类目录
     for category_dir in os.listdir(input_dir):
@@ -312,18 +540,43 @@ def main():
                 # 清理连续的下划线
                 asset_id = re.sub(r'_+', '_', asset_id).strip('_')
             
-            # 检查输出目录是否已存在
+            # 按源文件内容与输出完整性判断是否需要转换
             asset_output_dir = os.path.join(output_dir, asset_id)
-            if os.path.exists(asset_output_dir) and not args.force:
-                print(f"跳过已存在的素材: {asset_id}")
-                continue
-            
-            print(f"处理素材: {asset_id} ({filename})")
+            entry = manifest.get(asset_id)
+            fingerprint = source_fingerprint(video_path, entry)
+            if not args.force:
+                if is_up_to_date(entry, fingerprint, asset_output_dir):
+                    print(f"跳过未变化的素材: {asset_id}")
+                    continue
+                # 没有清单记录的旧输出无法确认与源文件一致，重新转换
             
-            if process_video(video_path, asset_output_dir, asset_id):
-                processed_count += 1
-            else:
-                print(f"处理失败: {asset_id}")
+            tasks.append((video_path, asset_output_dir, asset_id, fingerprint))
+    
+    save_manifest(output_dir, manifest)
+    print(f"\n待转换素材: {len(tasks)} 个，并行进程数: {max(1, args.jobs)}")
+    
+    def record(result, video_path, fingerprint):
+        nonlocal processed_count
+        asset_id, ok, outputs = result
+        if ok:
+            processed_count += 1
+            manifest[asset_id] = dict(fingerprint, source=video_path, outputs=outputs, converted_at=time.time())
+            save_manifest(output_dir, manifest)
+        else:
+            print(f"处理失败: {asset_id}")
+    
+    if args.jobs > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+            futures = {
+                pool.submit(convert_asset, video_path, asset_output_dir, asset_id, args.pack, args.key_tolerance, args.key_mode): (video_path, fingerprint)
+                for video_path, asset_output_dir, asset_id, fingerprint in tasks
+            }
+            for future in as_completed(futures):
+                record(future.result(), *futures[future])
+    else:
+        for video_path, asset_output_dir, asset_id, fingerprint in tasks:
+            print(f"处理素材: {asset_id} ({os.path.basename(video_path)})")
+            record(convert_asset(video_path, asset_output_dir, asset_id, pack=args.pack, key_tolerance=args.key_tolerance, key_mode=args.key_mode), video_path, fingerprint)
     
     print(f"\n批量转换完成，共处理 {processed_count} 个素材")
     
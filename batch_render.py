@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+"""
+批量渲染
+从 JSONL 任务文件读取任务，每行一个 JSON 对象:
+    {"id": "可选", "script": "剧本文件路径或剧本列表", "title": "标题",
+     "resolution": [1080, 1440], "fps": 24, "output_dir": "output"}
+同一进程内的任务共享字体、素材读取器、精灵、背景与音频缓存；
+可用多个长驻进程并行处理任务，每个进程持有自己的一份缓存。
+每个任务的结果以 JSONL 追加写入清单文件
+"""
+
+import json
+import os
+import shutil
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from render_caches import RenderCaches
+
+# 工作进程内的共享缓存与渲染参数，由 _init_batch_worker 创建
+_process_caches = None
+_process_options = None
+
+
+def load_jobs(jobs_path):
+    """读取任务文件，跳过空行与 # 开头的注释行；未指定 id 的任务以行号命名"""
+    jobs = []
+    with open(jobs_path, 'r', encoding='utf-8') as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            job = json.loads(line)
+            job.setdefault('id', f"job_{line_no}")
+            jobs.append(job)
+    return jobs
+
+
+def _load_script(job):
+    script = job['script']
+    if isinstance(script, str):
+        with open(script, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return script
+
+
+def _make_caches(options):
+    return RenderCaches(
+        options.get('sprite_cache_mb', 512),
+        options.get('background_cache_dir', "cache/backgrounds"),
+        reader_pool_size=options.get('reader_pool_size', 16),
+        reader_cache_mb=options.get('reader_cache_mb', 1024)
+    )
+
+
+def run_job(job, caches, options):
+    """渲染单个任务，返回写入清单的结果，异常不向外抛出"""
+    from main import VideoGenerator
+
+    started = time.time()
+    result = {"id": job['id'], "title": job.get('title'), "status": "ok"}
+    generator = None
+    try:
+        kwargs = dict(options)
+        if 'resolution' in job:
+            kwargs['resolution'] = tuple(job['resolution'])
+        if 'fps' in job:
+            kwargs['fps'] = job['fps']
+        if 'output_dir' in job:
+            kwargs['output_dir'] = job['output_dir']
+
+        print(f"\n==== [批量渲染] 开始任务 {job['id']} ====")
+        generator = VideoGenerator(_load_script(job), title=job.get('title') or job['id'], caches=caches, **kwargs)
+        generator.generate_video()
+        result["output"] = generator.result_path
+        result["frames"] = generator.timeline.total_frames
+        result["network"] = generator.network_stats
+    except Exception as e:
+        result["status"] = "error"
+        result["error"] = str(e)
+        result["traceback"] = traceback.format_exc()
+        print(f"[批量渲染] 任务 {job['id']} 失败: {str(e)}")
+        if generator is not None and os.path.isdir(generator.temp_dir):
+            shutil.rmtree(generator.temp_dir, ignore_errors=True)
+    result["elapsed_s"] = round(time.time() - started, 3)
+    result["pid"] = os.getpid()
+    return result
+
+
+def _init_batch_worker(options):
+    global _process_caches, _process_options
+    _process_options = options
+    _process_caches = _make_caches(options)
+
+
+def _run_job_in_worker(job):
+    return run_job(job, _process_caches, _process_options)
+
+
+def run_batch(jobs_path, manifest_path, options, procs=1):
+    """
+    渲染任务文件中的所有任务
+    options: 传给 VideoGenerator 的公共参数，任务中的 resolution/fps/output_dir 会覆盖对应项
+    返回成功的任务数
+    """
+    jobs = load_jobs(jobs_path)
+    procs = max(1, min(procs, len(jobs) or 1))
+    print(f"[批量渲染] 共 {len(jobs)} 个任务，{procs} 个进程，结果清单: {manifest_path}")
+
+    manifest_dir = os.path.dirname(manifest_path)
+    if manifest_dir:
+        os.makedirs(manifest_dir, exist_ok=True)
+
+    succeeded = 0
+    started = time.time()
+    with open(manifest_path, 'w', encoding='utf-8') as manifest:
+        def record(result):
+            nonlocal succeeded
+            succeeded += result["status"] == "ok"
+            manifest.write(json.dumps(result, ensure_ascii=False) + "\n")
+            manifest.flush()
+
+        if procs == 1:
+            caches = _make_caches(options)
+            try:
+                for job in jobs:
+                    record(run_job(job, caches, options))
+            finally:
+                caches.close()
+        else:
+            with ProcessPoolExecutor(
+                max_workers=procs,
+                initializer=_init_batch_worker,
+                initargs=(options,)
+            ) as pool:
+                futures = [pool.submit(_run_job_in_worker, job) for job in jobs]
+                for future in as_completed(futures):
+                    record(future.result())
+
+    print(f"\n[批量渲染] 完成 {succeeded}/{len(jobs)} 个任务，总耗时 {time.time() - started:.1f}s")
+    return succeeded
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+抠像性能对比
+对比原逐帧抠像函数与 chroma_key 批量抠像的吞吐量，并检查结果差异
+    python benchmark_keying.py                      # 使用合成的 1080p 绿幕帧
+    python benchmark_keying.py --video 素材.mp4      # 使用真实视频的前 N 帧
+"""
+
+import argparse
+import time
+
+import cv2
+import numpy as np
+
+from chroma_key import ChromaKeyer, IncrementalKeyer, sample_key_range, sampled_keyer
+
+
+def legacy_remove_green_background(frame):
+    """batch_convert_mp4 / debug_conversion 原逐帧实现"""
+    hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
+    mask = cv2.inRange(hsv, np.array([40, 40, 40]), np.array([80, 255, 255]))
+    kernel = np.ones((3, 3), np.uint8)
+    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel)
+    mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel)
+    rgba_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGBA)
+    rgba_frame[:, :, 3] = 255 - mask
+    return rgba_frame
+
+
+def legacy_create_alpha_channel(frame, bg_hsv_range):
+    """generate_png_audio 原逐帧实现"""
+    hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
+    lower = np.array([bg_hsv_range[0], bg_hsv_range[1], bg_hsv_range[2]])
+    upper = np.array([bg_hsv_range[3], bg_hsv_range[4], bg_hsv_range[5]])
+    mask = cv2.inRange(hsv, lower, upper)
+    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (5, 5))
+    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel, iterations=2)
+    mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel, iterations=1)
+    dilate_kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (30, 30))
+    mask = cv2.dilate(mask, dilate_kernel, iterations=1)
+    mask = cv2.GaussianBlur(mask, (7, 7), 0)
+    return cv2.bitwise_not(mask)
+
+
+def synthetic_frames(count, width, height):
+    """绿幕背景上移动的彩色圆形与矩形"""
+    frames = np.empty((count, height, width, 3), np.uint8)
+    for i in range(count):
+        frame = frames[i]
+        frame[:] = (40, 200, 40)
+        cx = width // 3 + i * width // (3 * max(1, count))
+        cv2.circle(frame, (cx, height // 2), height // 5, (30, 60, 200), -1)
+        cv2.rectangle(frame, (width // 2, height // 4), (width // 2 + width // 6, height // 3 + i), (200, 120, 50), -1)
+    return frames
+
+
+def video_frames(path, count):
+    cap = cv2.VideoCapture(path)
+    frames = []
+    while len(frames) < count:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cap.release()
+    if not frames:
+        raise RuntimeError(f"无法读取视频: {path}")
+    return np.stack(frames)
+
+
+def timed(func, repeat):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def run_case(name, frames, legacy, batched, repeat):
+    legacy_s, legacy_out = timed(lambda: np.stack([legacy(f) for f in frames]), repeat)
+    batched_s, batched_out = timed(batched, repeat)
+    diff = np.abs(legacy_out.astype(np.int16) - batched_out.astype(np.int16))
+    n = len(frames)
+    print(f"{name:<20}{n / legacy_s:>12.1f}{n / batched_s:>12.1f}{legacy_s / batched_s:>8.2f}x"
+          f"{int(diff.max()):>10}{float((diff > 0).mean()) * 100:>10.3f}%")
+
+
+def batched_alpha(keyer, frames, chunk_size):
+    out = np.empty(frames.shape[:3], np.uint8)
+    for start in range(0, len(frames), chunk_size):
+        out[start:start + chunk_size] = keyer.alpha(frames[start:start + chunk_size])
+    return out
+
+
+def batched_rgba(keyer, frames, chunk_size):
+    out = np.empty(frames.shape[:3] + (4,), np.uint8)
+    for start in range(0, len(frames), chunk_size):
+        keyer.key(frames[start:start + chunk_size], out=out[start:start + chunk_size])
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description='抠像性能对比')
+    parser.add_argument('--video', help='使用该视频的帧（默认使用合成帧）')
+    parser.add_argument('--frames', type=int, default=48, help='测试帧数')
+    parser.add_argument('--size', default='1920x1080', help='合成帧尺寸，宽x高')
+    parser.add_argument('--chunk', type=int, default=16, help='批量抠像每块帧数')
+    parser.add_argument('--repeat', type=int, default=3, help='重复次数，取最快一次')
+    parser.add_argument('--fast-scale', type=int, default=4, help='快速膨胀的缩小倍数')
+    parser.add_argument('--tolerance', type=int, default=8, help='增量抠像的容差')
+    args = parser.parse_args()
+
+    if args.video:
+        frames = video_frames(args.video, args.frames)
+    else:
+        width, height = (int(v) for v in args.size.lower().split('x'))
+        frames = synthetic_frames(args.frames, width, height)
+    key_range = sample_key_range(frames[0])
+
+    print(f"帧数: {len(frames)}  尺寸: {frames.shape[2]}x{frames.shape[1]}  块大小: {args.chunk}")
+    print(f"{'算法':<20}{'逐帧(fps)':>12}{'批量(fps)':>12}{'加速':>9}{'最大差异':>10}{'差异像素':>11}")
+
+    fixed = ChromaKeyer()
+    run_case("固定阈值 RGBA", frames, legacy_remove_green_background,
+             lambda: batched_rgba(fixed, frames, args.chunk), args.repeat)
+
+    sampled = sampled_keyer(key_range)
+    run_case("采样背景 alpha", frames, lambda f: legacy_create_alpha_channel(f, key_range),
+             lambda: batched_alpha(sampled, frames, args.chunk), args.repeat)
+
+    fast = sampled_keyer(key_range, fast_dilate_scale=args.fast_scale)
+    run_case(f"采样背景 快速膨胀/{args.fast_scale}", frames, lambda f: legacy_create_alpha_channel(f, key_range),
+             lambda: batched_alpha(fast, frames, args.chunk), args.repeat)
+
+    # 每次计时都从空参考帧开始，第一帧总是完整抠像
+    run_case(f"采样背景 增量/{args.tolerance}", frames, lambda f: legacy_create_alpha_channel(f, key_range),
+             lambda: batched_alpha(IncrementalKeyer(sampled_keyer(key_range), tolerance=args.tolerance),
+                                   frames, args.chunk), args.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,351 @@
+# -*- coding: utf-8 -*-
+"""
+批量绿幕抠像
+一次处理 N 帧组成的 (N, H, W, 3) BGR 数组：颜色空间转换、阈值等逐像素运算在整块上一次完成，
+形态学、膨胀、模糊逐帧写入预分配的缓冲，块大小不变时不再分配内存。
+大尺寸膨胀可在缩小的掩码上进行（fast_dilate_scale > 1），结果略偏保守，绿边去得稍多
+"""
+
+import cv2
+import numpy as np
+
+# 固定阈值绿幕（batch_convert_mp4 / debug_conversion 使用）
+GREEN_LOWER = (40, 40, 40)
+GREEN_UPPER = (80, 255, 255)
+
+
+class ChromaKeyer:
+    """
+    lower/upper: HSV 绿色范围
+    kernel: 去噪用的形态学核，先闭运算 close_iterations 次再开运算 open_iterations 次
+    dilate_size: >0 时用该尺寸的椭圆核膨胀掩码，消除绿边
+    blur_size: >0 时对掩码做高斯模糊，平滑边缘
+    fast_dilate_scale: >1 时膨胀在缩小该倍数的掩码上进行
+    """
+
+    def __init__(self, lower=GREEN_LOWER, upper=GREEN_UPPER, kernel=None, close_iterations=1,
+                 open_iterations=1, dilate_size=0, blur_size=0, fast_dilate_scale=1):
+        self.lower = np.array(lower)
+        self.upper = np.array(upper)
+        self.kernel = np.ones((3, 3), np.uint8) if kernel is None else kernel
+        self.close_iterations = close_iterations
+        self.open_iterations = open_iterations
+        self.dilate_size = dilate_size
+        self.blur_size = blur_size
+        self.fast_dilate_scale = max(1, int(fast_dilate_scale))
+        if dilate_size:
+            size = dilate_size
+            if self.fast_dilate_scale > 1:
+                size = max(1, int(round(dilate_size / self.fast_dilate_scale)))
+            self.dilate_kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (size, size))
+        self._capacity = 0
+        self._scratch_capacity = 0
+
+    @property
+    def support_radius(self):
+        """输出掩码上一个像素最远受多远之外的输入像素影响"""
+        k = max(self.kernel.shape) // 2
+        radius = 2 * k * (self.close_iterations + self.open_iterations)
+        if self.dilate_size:
+            radius += self.dilate_size // 2 + 2 * self.fast_dilate_scale
+        if self.blur_size:
+            radius += self.blur_size // 2
+        return radius
+
+    def _buffers(self, n, h, w):
+        # 缓冲按像素数分配，尺寸变化时只要不超过已分配容量就直接取视图
+        size = n * h * w
+        if size > self._capacity:
+            self._capacity = size
+            self._hsv_buf = np.empty(size * 3, np.uint8)
+            self._mask_buf = np.empty(size, np.uint8)
+            self._alpha_buf = np.empty(size, np.uint8)
+        if h * w > self._scratch_capacity:
+            self._scratch_capacity = h * w
+            self._scratch_buf = np.empty(h * w, np.uint8)
+        return (
+            self._hsv_buf[:size * 3].reshape(n * h, w, 3),
+            self._mask_buf[:size].reshape(n, h, w),
+            self._scratch_buf[:h * w].reshape(h, w),
+        )
+
+    def mask(self, frames):
+        """
+        frames: (N, H, W, 3) 或 (H, W, 3) 的 BGR uint8
+        返回绿色区域为 255 的掩码，结果位于内部缓冲，下次调用时会被覆盖
+        """
+        single = frames.ndim == 3
+        if single:
+            frames = frames[None]
+        n, h, w = frames.shape[:3]
+        hsv, masks, scratch = self._buffers(n, h, w)
+
+        # 逐像素运算：整块帧当作一张 (N*H, W) 的图像处理
+        flat = np.ascontiguousarray(frames).reshape(n * h, w, 3)
+        cv2.cvtColor(flat, cv2.COLOR_BGR2HSV, dst=hsv)
+        cv2.inRange(hsv, self.lower, self.upper, dst=masks.reshape(n * h, w))
+
+        # 空间运算：逐帧进行，避免跨帧串扰；在掩码与临时缓冲之间来回写入，不做多余拷贝
+        for mask in masks:
+            src, dst = mask, scratch
+            if self.close_iterations:
+                cv2.morphologyEx(src, cv2.MORPH_CLOSE, self.kernel, dst=dst, iterations=self.close_iterations)
+                src, dst = dst, src
+            if self.open_iterations:
+                cv2.morphologyEx(src, cv2.MORPH_OPEN, self.kernel, dst=dst, iterations=self.open_iterations)
+                src, dst = dst, src
+            if self.dilate_size:
+                self._dilate(src, dst)
+                src, dst = dst, src
+            if self.blur_size:
+                cv2.GaussianBlur(src, (self.blur_size, self.blur_size), 0, dst=dst)
+                src, dst = dst, src
+            if src is not mask:
+                mask[:] = src
+        return masks[0] if single else masks
+
+    def _dilate(self, src, dst):
+        scale = self.fast_dilate_scale
+        if scale == 1:
+            cv2.dilate(src, self.dilate_kernel, dst=dst, iterations=1)
+            return
+        # 缩小后任意覆盖到绿色的像素都记为绿色，膨胀后再最近邻放大回原尺寸；
+        # 宽高不是 scale 的整数倍时先在右、下补 0 到整数倍，缩小网格总是从 (0, 0) 起按 scale 对齐，
+        # 局部区域（IncrementalKeyer）与整帧落在同一网格上
+        h, w = src.shape
+        ph, pw = -(-h // scale) * scale, -(-w // scale) * scale
+        if (ph, pw) != (h, w):
+            src = cv2.copyMakeBorder(src, 0, ph - h, 0, pw - w, cv2.BORDER_CONSTANT, value=0)
+        small = cv2.resize(src, (pw // scale, ph // scale), interpolation=cv2.INTER_AREA)
+        small[small > 0] = 255
+        small = cv2.dilate(small, self.dilate_kernel, iterations=1)
+        if (ph, pw) != (h, w):
+            dst[:] = cv2.resize(small, (pw, ph), interpolation=cv2.INTER_NEAREST)[:h, :w]
+        else:
+            cv2.resize(small, (w, h), dst=dst, interpolation=cv2.INTER_NEAREST)
+
+    def alpha(self, frames):
+        """返回 alpha（绿色区域为 0），结果位于内部缓冲，下次调用时会被覆盖"""
+        masks = self.mask(frames)
+        alpha = self._alpha_buf[:masks.size].reshape(masks.shape)
+        np.subtract(255, masks, out=alpha)
+        return alpha
+
+    def key(self, frames, out=None, order="rgba"):
+        """
+        抠像并返回 4 通道图像，order 为 "rgba" 时颜色通道顺序与 cv2.COLOR_BGR2RGBA 一致，
+        为 "bgra" 时保持输入顺序；out 可传入预分配的数组
+        """
+        alpha = self.alpha(frames)
+        if out is None:
+            out = np.empty(frames.shape[:-1] + (4,), np.uint8)
+        h, w = frames.shape[-3:-1]
+        if out.flags.c_contiguous:
+            # 整块一次颜色转换，比 NumPy 按通道倒序拷贝快得多
+            code = cv2.COLOR_BGR2RGBA if order == "rgba" else cv2.COLOR_BGR2BGRA
+            cv2.cvtColor(np.ascontiguousarray(frames).reshape(-1, w, 3), code, dst=out.reshape(-1, w, 4))
+        else:
+            out[..., :3] = frames[..., ::-1] if order == "rgba" else frames
+        out[..., 3] = alpha
+        return out
+
+
+def sample_key_range(frame, sample_size=100):
+    """从左上角采样背景色，返回 (H下限, S下限, V下限, H上限, S上限, V上限)"""
+    sample = frame[:sample_size, :sample_size]
+    hsv = cv2.cvtColor(sample, cv2.COLOR_BGR2HSV)
+
+    h = hsv[:, :, 0].flatten()
+    s = hsv[:, :, 1].flatten()
+    v = hsv[:, :, 2].flatten()
+
+    return (
+        max(0, np.percentile(h, 5) - 5),
+        max(0, np.percentile(s, 5) - 10),
+        max(0, np.percentile(v, 5) - 10),
+        min(180, np.percentile(h, 95) + 5),
+        min(255, np.percentile(s, 95) + 10),
+        min(255, np.percentile(v, 95) + 10)
+    )
+
+
+def calibrate_key_range(frames, border=0.08, hue_window=12):
+    """
+    从多帧画面四周的边框采样幕布颜色，返回与 sample_key_range 相同格式的 HSV 范围：
+    只取饱和度足够、色相在直方图峰值附近的像素，避免主体入镜的部分干扰；
+    比幕布更亮、更饱和的像素同样视为背景。边框大多不是纯色幕布时返回 None
+    frames: BGR 帧序列，建议取自整段视频的不同位置
+    """
+    samples = []
+    for frame in frames:
+        h, w = frame.shape[:2]
+        bh, bw = max(1, int(h * border)), max(1, int(w * border))
+        for strip in (frame[:bh], frame[-bh:], frame[:, :bw], frame[:, -bw:]):
+            hsv = cv2.cvtColor(np.ascontiguousarray(strip), cv2.COLOR_BGR2HSV)
+            samples.append(hsv.reshape(-1, 3))
+    if not samples:
+        return None
+    hsv = np.concatenate(samples)
+
+    saturated = hsv[hsv[:, 1] >= 40]
+    if len(saturated) < 0.2 * len(hsv):
+        return None
+    peak = int(np.bincount(saturated[:, 0], minlength=180).argmax())
+    background = saturated[np.abs(saturated[:, 0].astype(np.int16) - peak) <= hue_window]
+    if len(background) < 0.5 * len(saturated):
+        return None
+
+    low = np.percentile(background, 1, axis=0)
+    high = np.percentile(background, 99, axis=0)
+    return (
+        max(0, low[0] - 5),
+        max(30, low[1] - 20),
+        max(30, low[2] - 30),
+        min(180, high[0] + 5),
+        255,
+        255
+    )
+
+
+def key_profile(key_range, method):
+    """HSV 范围 -> 写入素材元数据的键控参数"""
+    return {
+        "method": method,
+        "lower": [round(float(v), 2) for v in key_range[:3]],
+        "upper": [round(float(v), 2) for v in key_range[3:]],
+    }
+
+
+def profile_key_range(profile):
+    """键控参数 -> HSV 范围，参数缺失时返回 None"""
+    if not profile or 'lower' not in profile or 'upper' not in profile:
+        return None
+    return tuple(profile['lower']) + tuple(profile['upper'])
+
+
+def sampled_keyer(key_range, fast_dilate_scale=1):
+    """generate_png_audio 使用的采样背景抠像：较强去噪 + 30x30 膨胀去绿边 + 模糊边缘"""
+    return ChromaKeyer(
+        lower=key_range[:3], upper=key_range[3:],
+        kernel=cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (5, 5)),
+        close_iterations=2, open_iterations=1,
+        dilate_size=30, blur_size=7,
+        fast_dilate_scale=fast_dilate_scale
+    )
+
+
+def iter_frame_chunks(frames, chunk_size=16):
+    """
+    将逐帧迭代器按 chunk_size 帧一组填入预分配的 (N, H, W, 3) 缓冲
+    产出 (起始帧号, 帧块)，帧块在下一次产出时会被覆盖
+    """
+    buffer = None
+    start = 0
+    n = 0
+    for frame in frames:
+        if buffer is None:
+            buffer = np.empty((chunk_size,) + frame.shape, frame.dtype)
+        buffer[n] = frame
+        n += 1
+        if n == chunk_size:
+            yield start, buffer
+            start += n
+            n = 0
+    if n:
+        yield start, buffer[:n]
+
+
+class IncrementalKeyer:
+    """
+    固定机位素材的增量抠像：逐帧与各图块上次抠像时的画面比较，
+    只对变化超过 tolerance 的图块（连同受其影响的相邻图块）重新抠像，其余图块沿用上次的 alpha。
+    比较对象是图块上次抠像时的参考帧而非上一帧，缓慢变化累积超过 tolerance 也会触发重新抠像，
+    漂移不超过 tolerance；tolerance 为 0 时结果与逐帧完整抠像逐像素一致
+    （快速膨胀时局部区域与整帧按同一缩小网格对齐，宽高不是缩小倍数整数倍的帧也一样）
+    接口与 ChromaKeyer 相同，帧块内按顺序逐帧处理
+    """
+
+    def __init__(self, keyer, tile_size=64, tolerance=0):
+        self.keyer = keyer
+        self.tolerance = tolerance
+        # 图块边长取快速膨胀缩小倍数的整数倍，保证局部抠像与整帧的缩小网格对齐
+        scale = keyer.fast_dilate_scale
+        self.tile_size = -(-tile_size // scale) * scale
+        self.halo = -(-keyer.support_radius // scale) * scale
+        reach = -(-self.halo // self.tile_size)
+        self._spread = np.ones((2 * reach + 1, 2 * reach + 1), np.uint8)
+        self.tiles_keyed = 0
+        self.tiles_total = 0
+        self.reset()
+
+    def reset(self):
+        """丢弃参考帧，下一帧完整抠像（切换素材时调用）"""
+        self._reference = None
+        self._mask = None
+
+    def _frame_mask(self, frame):
+        h, w = frame.shape[:2]
+        t = self.tile_size
+        rows, cols = -(-h // t), -(-w // t)
+        self.tiles_total += rows * cols
+
+        if self._reference is None or self._reference.shape != frame.shape:
+            self._reference = frame.copy()
+            self._mask = self.keyer.mask(frame).copy()
+            # 补齐到整数个图块的变化标记缓冲，补齐部分始终为 0
+            self._changed_px = np.zeros((rows * t, cols * t * 3), np.uint8)
+            self.tiles_keyed += rows * cols
+            return self._mask
+
+        # 任一通道与参考帧的差值超过容差即标记，再按图块取最大值得到变化图块
+        diff = cv2.absdiff(frame, self._reference).reshape(h, w * 3)
+        cv2.threshold(diff, self.tolerance, 255, cv2.THRESH_BINARY, dst=self._changed_px[:h, :w * 3])
+        changed = self._changed_px.reshape(rows, t, cols, t * 3).max(axis=(1, 3)) > 0
+        if not changed.any():
+            return self._mask
+
+        # 变化会影响 halo 范围内的掩码，相邻图块也需重新抠像
+        dirty = cv2.dilate(changed.astype(np.uint8), self._spread) > 0
+        self.tiles_keyed += int(dirty.sum())
+
+        # 每一行图块把需要重抠的连续区间合并为一个矩形，外扩 halo 抠像后只写回需要的图块
+        for row in np.flatnonzero(dirty.any(axis=1)):
+            cols_dirty = np.flatnonzero(dirty[row])
+            y0, y1 = row * t, min(h, (row + 1) * t)
+            x0, x1 = cols_dirty[0] * t, min(w, (cols_dirty[-1] + 1) * t)
+            ry0, rx0 = max(0, y0 - self.halo), max(0, x0 - self.halo)
+            ry1, rx1 = min(h, y1 + self.halo), min(w, x1 + self.halo)
+            region = self.keyer.mask(frame[ry0:ry1, rx0:rx1])
+            for col in cols_dirty:
+                tx0, tx1 = col * t, min(w, (col + 1) * t)
+                self._mask[y0:y1, tx0:tx1] = region[y0 - ry0:y1 - ry0, tx0 - rx0:tx1 - rx0]
+                self._reference[y0:y1, tx0:tx1] = frame[y0:y1, tx0:tx1]
+        return self._mask
+
+    def mask(self, frames):
+        """返回绿色区域为 255 的掩码；单帧时结果为内部状态，下次调用时会被覆盖"""
+        if frames.ndim == 3:
+            return self._frame_mask(frames)
+        return np.stack([self._frame_mask(frame).copy() for frame in frames])
+
+    def alpha(self, frames):
+        return 255 - self.mask(frames)
+
+    def key(self, frames, out=None, order="rgba"):
+        alpha = self.alpha(frames)
+        if out is None:
+            out = np.empty(frames.shape[:-1] + (4,), np.uint8)
+        code = cv2.COLOR_BGR2RGBA if order == "rgba" else cv2.COLOR_BGR2BGRA
+        if frames.ndim == 3:
+            cv2.cvtColor(frames, code, dst=out)
+        else:
+            for frame, rgba in zip(frames, out):
+                cv2.cvtColor(frame, code, dst=rgba)
+        out[..., 3] = alpha
+        return out
+
+    @property
+    def reuse_ratio(self):
+        if not self.tiles_total:
+            return 0.0
+        return 1.0 - self.tiles_keyed / self.tiles_total
@@ -1,5 +1,6 @@
 import json
-import os
+
+from asset_catalogue import AssetCatalogue
 
 def clean_detail_json():
     # 读取detail.json
@@ -9,21 +10,15 @@ def clean_detail_json():
     
     print(f'原始素材数量: {len(data)}')
     
-    # 过滤出有效的素材（存在PNG目录的）
+    # 过滤出有效的素材（有可渲染的帧：视频、打包帧或PNG序列），查询素材索引而不扫描目录
+    catalogue = AssetCatalogue.load('./memes')
     valid_assets = []
     invalid_assets = []
     
     for item in data:
         asset_id = item['id']
-        asset_dir = f'./memes/{asset_id}'
-        
-        # 检查素材目录是否存在且包含PNG文件
-        if os.path.exists(asset_dir):
-            png_files = [f for f in os.listdir(asset_dir) if f.endswith('.png')]
-            if png_files:
-                valid_assets.append(item)
-            else:
-                invalid_assets.append(asset_id)
+        if catalogue.usable(asset_id):
+            valid_assets.append(item)
         else:
             invalid_assets.append(asset_id)
     
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+"""
+NumPy 帧合成器
+所有图层以预乘 alpha 的 BGR 数组保存，合成时只在图层包围盒内运算，
+结果写入一块预分配的 uint8 HxWx3 (BGR) 帧缓冲，可直接交给 cv2.VideoWriter；
+场景内静态的部分（背景、字幕、标题）合成为底图，逐帧只重绘前景所在的脏矩形
+"""
+
+import numpy as np
+
+
+class Layer:
+    """
+    预乘 alpha 图层
+    premul: HxWx3 uint8，BGR 顺序，已乘以 alpha
+    inv_alpha: HxWx1 uint8，即 255 - alpha
+    x, y: 图层左上角在帧中的位置
+    """
+
+    __slots__ = ('premul', 'inv_alpha', 'x', 'y')
+
+    def __init__(self, premul, inv_alpha, x=0, y=0):
+        self.premul = premul
+        self.inv_alpha = inv_alpha
+        self.x = x
+        self.y = y
+
+    @property
+    def width(self):
+        return self.premul.shape[1]
+
+    @property
+    def height(self):
+        return self.premul.shape[0]
+
+    @property
+    def nbytes(self):
+        return self.premul.nbytes + self.inv_alpha.nbytes
+
+
+def union_rect(rects):
+    """多个矩形 (x0, y0, x1, y1) 的并集包围盒，忽略空矩形，全为空时返回 (0, 0, 0, 0)"""
+    rects = [r for r in rects if r[0] < r[2] and r[1] < r[3]]
+    if not rects:
+        return (0, 0, 0, 0)
+    return (min(r[0] for r in rects), min(r[1] for r in rects),
+            max(r[2] for r in rects), max(r[3] for r in rects))
+
+
+def layer_from_rgba(rgba, offset=(0, 0)):
+    """将 RGBA (RGB 顺序，非预乘) 的数组或 PIL 图像转换为预乘 BGR 图层"""
+    rgba = np.asarray(rgba)
+    alpha = rgba[:, :, 3:4].astype(np.uint16)
+    premul = rgba[:, :, 2::-1] * alpha
+    premul += 127
+    premul //= 255
+    inv_alpha = 255 - rgba[:, :, 3:4]
+    return Layer(premul.astype(np.uint8), np.ascontiguousarray(inv_alpha), offset[0], offset[1])
+
+
+class FrameCompositor:
+    """
+    在固定帧缓冲上逐层做预乘 alpha 合成:
+        dst = premul + dst * (255 - alpha) / 255
+    除帧缓冲外只额外持有两块 uint16 临时缓冲，逐帧不再分配整幅画布
+    """
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.frame = np.zeros((height, width, 3), dtype=np.uint8)
+        self._scratch = np.empty((height, width, 3), dtype=np.uint16)
+        self._carry = np.empty((height, width, 3), dtype=np.uint16)
+        self.base = None  # 帧缓冲在脏矩形外与该底图一致
+        self.bounds = None  # 合成范围 (x0, y0, x1, y1)，None 为整帧
+
+    def begin(self, background=None):
+        """以背景 (HxWx3 BGR) 开始新的一帧，背景为空时填充黑色"""
+        self.base = None
+        self.bounds = None
+        if background is None:
+            self.frame.fill(0)
+        else:
+            np.copyto(self.frame, background)
+        return self.frame
+
+    def render_base(self, background, layers):
+        """在背景上依次合成静态图层，返回新的底图数组，不改动帧缓冲"""
+        base = np.zeros_like(self.frame) if background is None else background.copy()
+        for layer in layers:
+            if layer is not None:
+                self._blend_into(base, layer, layer.x, layer.y, None)
+        return base
+
+    def begin_dirty(self, base, background, rect):
+        """
+        脏矩形方式开始新的一帧
+        base: render_base 生成的底图（背景 + 场景内全部静态图层）
+        rect: 本场景前景的并集包围盒 (x0, y0, x1, y1)，只在其中恢复背景
+        之后的 blend 都裁剪到 rect 内，按原先的层次重新合成前景与其上下的静态图层；
+        底图与上一帧相同时 rect 外的像素保持不动
+        """
+        if base is not self.base:
+            np.copyto(self.frame, base)
+            self.base = base
+        self.bounds = rect
+        x0, y0, x1, y1 = rect
+        if x0 < x1 and y0 < y1:
+            if background is None:
+                self.frame[y0:y1, x0:x1].fill(0)
+            else:
+                np.copyto(self.frame[y0:y1, x0:x1], background[y0:y1, x0:x1])
+        return self.frame
+
+    def layer_rect(self, x, y, width, height):
+        """图层放在 (x, y) 时与帧的交集 (x0, y0, x1, y1)，不相交时为空矩形"""
+        x0, y0 = max(x, 0), max(y, 0)
+        x1, y1 = min(x + width, self.width), min(y + height, self.height)
+        return (x0, y0, max(x0, x1), max(y0, y1))
+
+    def clip(self, layer, x, y, bounds=None):
+        """
+        计算图层放在 (x, y) 时与帧（以及 bounds）的交集
+        返回 (帧切片, 图层切片)，完全在范围外时返回 None
+        """
+        bx0, by0, bx1, by1 = bounds or (0, 0, self.width, self.height)
+        x0 = max(x, bx0)
+        y0 = max(y, by0)
+        x1 = min(x + layer.width, bx1)
+        y1 = min(y + layer.height, by1)
+        if x0 >= x1 or y0 >= y1:
+            return None
+        frame_roi = (slice(y0, y1), slice(x0, x1))
+        layer_roi = (slice(y0 - y, y1 - y), slice(x0 - x, x1 - x))
+        return frame_roi, layer_roi
+
+    def blend(self, layer, x=None, y=None):
+        """
+        将图层合成到帧缓冲，只处理图层包围盒内（脏矩形方式下还须在脏矩形内）的像素
+        x, y 未指定时使用图层自带的位置（缓存的精灵图层可在不同位置复用）
+        """
+        if layer is None:
+            return
+        self._blend_into(self.frame, layer, layer.x if x is None else x, layer.y if y is None else y, self.bounds)
+
+    def _blend_into(self, frame, layer, x, y, bounds):
+        rois = self.clip(layer, x, y, bounds)
+        if rois is None:
+            return
+        frame_roi, layer_roi = rois
+        dst = frame[frame_roi]
+        h, w = dst.shape[:2]
+        scratch = self._scratch[:h, :w]
+        carry = self._carry[:h, :w]
+
+        # dst * inv_alpha / 255，用 (t + (t >> 8)) >> 8 实现精确舍入，全程不超出 uint16
+        np.multiply(dst, layer.inv_alpha[layer_roi], out=scratch, dtype=np.uint16)
+        scratch += 128
+        np.right_shift(scratch, 8, out=carry)
+        scratch += carry
+        scratch >>= 8
+        np.add(scratch, layer.premul[layer_roi], out=scratch, dtype=np.uint16)
+        np.copyto(dst, scratch, casting='unsafe')
@@ -10,32 +10,16 @@ import os
 import tempfile
 import shutil
 
+from chroma_key import ChromaKeyer
+
+# 与 batch_convert_mp4 相同的固定阈值抠像，复用同一个实例的临时缓冲
+_keyer = ChromaKeyer()
+
 def remove_green_background(frame, threshold=50):
     """
     移除绿幕背景，返回RGBA格式
     """
-    # 转换为HSV色彩空间
-    hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
-    
-    # 定义绿色范围
-    lower_green = np.array([40, 40, 40])
-    upper_green = np.array([80, 255, 255])
-    
-    # 创建绿色掩码
-    mask = cv2.inRange(hsv, lower_green, upper_green)
-    
-    # 形态学操作，去除噪点
-    kernel = np.ones((3,3), np.uint8)
-    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel)
-    mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel)
-    
-    # 创建RGBA图像
-    rgba = cv2.cvtColor(frame, cv2.COLOR_BGR2RGBA)
-    
-    # 设置透明度：绿色区域为透明，其他区域为不透明
-    rgba[:, :, 3] = 255 - mask
-    
-    return rgba
+    return _keyer.key(frame)
 
 def find_content_bounds(frames):
     """
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""
+素材读取器池
+读取器按完整解码参数 (素材, 键控参数, 输出帧率) 缓存，
+打开的读取器数量与解码帧占用的内存都有上限，超出时按 LRU 淘汰并显式 close()；
+读取器的占用 (nbytes) 会随按需解码变化，每次淘汰检查时重新统计；
+正在被场景使用的读取器通过 acquire/release 计数固定，不会被淘汰
+"""
+
+from collections import OrderedDict
+
+
+class DecoderPool:
+    """按数量与字节预算淘汰的 LRU 读取器池，值为 asset_reader 接口的读取器"""
+
+    def __init__(self, max_open=16, budget_mb=1024):
+        self.max_open = max(1, max_open)
+        self.budget_bytes = int(budget_mb * 1024 * 1024)
+        self.peak_bytes = 0
+        self._readers = OrderedDict()  # 键 -> 读取器
+        self._pins = {}  # 键 -> 使用中的计数
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def acquire(self, key, open_reader):
+        """
+        取出读取器并计数固定，用完后需调用 release(key)
+        未命中时调用 open_reader() 打开，再按上限淘汰未固定的旧读取器
+        """
+        reader = self._readers.get(key)
+        if reader is not None:
+            self._readers.move_to_end(key)
+            self.hits += 1
+        else:
+            self.misses += 1
+            reader = open_reader()
+            self._readers[key] = reader
+        self._pins[key] = self._pins.get(key, 0) + 1
+        self._evict()
+        return reader
+
+    def release(self, key):
+        """取消一次固定；计数归零后读取器留在池中，可被淘汰"""
+        count = self._pins.get(key, 0) - 1
+        if count > 0:
+            self._pins[key] = count
+            return
+        self._pins.pop(key, None)
+        self._evict()
+
+    @property
+    def used_bytes(self):
+        return sum(reader.nbytes for reader in self._readers.values())
+
+    def _evict(self):
+        # 固定中的读取器即使超出上限也保留，等释放后再淘汰
+        used = self.used_bytes
+        self.peak_bytes = max(self.peak_bytes, used)
+        for key in list(self._readers):
+            if len(self._readers) <= self.max_open and used <= self.budget_bytes:
+                break
+            if key not in self._pins:
+                used -= self._readers[key].nbytes
+                self._close(key)
+                self.evictions += 1
+
+    def _close(self, key):
+        reader = self._readers.pop(key)
+        try:
+            reader.close()
+        except Exception as e:
+            print(f"关闭素材读取器失败 {key[0]}: {e}")
+
+    def close(self):
+        """关闭池中所有读取器（包括固定中的）"""
+        for key in list(self._readers):
+            self._close(key)
+        self._pins.clear()
+
+    def stats(self):
+        self.peak_bytes = max(self.peak_bytes, self.used_bytes)
+        return {
+            "open": len(self._readers),
+            "pinned": len(self._pins),
+            "used_mb": round(self.used_bytes / 1024 / 1024, 1),
+            "peak_mb": round(self.peak_bytes / 1024 / 1024, 1),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    def __contains__(self, key):
+        return key in self._readers
+
+    def __len__(self):
+        return len(self._readers)
@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+"""
+帧输出后端
+所有后端实现同一套接口 open() / write(frame) / close()，帧为 HxWx3 uint8 BGR，
+便于对 cv2、ffmpeg 管道与原始帧三种输出做基准对比
+"""
+
+import subprocess
+
+import cv2
+import numpy as np
+
+
+def get_ffmpeg_exe():
+    # moviepy 依赖 imageio-ffmpeg，优先使用其自带的 ffmpeg
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except Exception:
+        return 'ffmpeg'
+
+
+class FrameSink:
+    """
+    帧输出接口
+    muxes_audio 为 True 的后端在编码时直接封装音轨；为 False 时 path 只有画面，
+    由生成器之后调用 merge_audio 合成音轨；writes_video 为 False 的后端不输出视频，不合成音频
+    """
+
+    muxes_audio = False
+    writes_video = True
+
+    def __init__(self, path, width, height, fps):
+        self.path = path
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.frames_written = 0
+
+    def open(self):
+        return self
+
+    def write(self, frame):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def abort(self):
+        # 出错时释放资源，默认与 close 相同
+        self.close()
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
+
+
+class Cv2Sink(FrameSink):
+    """cv2.VideoWriter 写 mp4v 临时文件，之后需要 merge_audio 转码并合成音频"""
+
+    def __init__(self, path, width, height, fps, fourcc='mp4v'):
+        super().__init__(path, width, height, fps)
+        self.fourcc = fourcc
+        self.writer = None
+
+    def open(self):
+        self.writer = cv2.VideoWriter(
+            self.path,
+            cv2.VideoWriter_fourcc(*self.fourcc),
+            self.fps,
+            (self.width, self.height)
+        )
+        return self
+
+    def write(self, frame):
+        self.writer.write(frame)
+        self.frames_written += 1
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.release()
+            self.writer = None
+
+
+class FfmpegPipeSink(FrameSink):
+    """
+    将原始 BGR 帧通过管道送入单个 ffmpeg 进程，
+    一次完成 libx264 编码与音轨封装，不产生中间视频文件
+    """
+
+    muxes_audio = True
+
+    def __init__(self, path, width, height, fps, audio_path=None, preset='medium', crf=None):
+        super().__init__(path, width, height, fps)
+        self.audio_path = audio_path
+        self.preset = preset
+        self.crf = crf
+        self.proc = None
+
+    def build_command(self):
+        cmd = [
+            get_ffmpeg_exe(), '-y', '-hide_banner', '-loglevel', 'error',
+            '-f', 'rawvideo',
+            '-pix_fmt', 'bgr24',
+            '-s', f'{self.width}x{self.height}',
+            '-r', str(self.fps),
+            '-i', '-',
+        ]
+        if self.audio_path:
+            cmd += ['-i', self.audio_path]
+        cmd += ['-c:v', 'libx264', '-preset', self.preset, '-pix_fmt', 'yuv420p']
+        if self.crf is not None:
+            cmd += ['-crf', str(self.crf)]
+        if self.audio_path:
+            cmd += ['-c:a', 'aac', '-shortest']
+        cmd.append(self.path)
+        return cmd
+
+    def open(self):
+        cmd = self.build_command()
+        print("\n==== 启动FFmpeg编码管道 ====")
+        print(" ".join(cmd))
+        self.proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+        return self
+
+    def write(self, frame):
+        try:
+            self.proc.stdin.write(memoryview(np.ascontiguousarray(frame)))
+        except (BrokenPipeError, OSError) as e:
+            raise RuntimeError(f"FFmpeg编码进程异常退出: {self._read_error()}") from e
+        self.frames_written += 1
+
+    def close(self):
+        if self.proc is None:
+            return
+        _, stderr = self.proc.communicate()
+        returncode = self.proc.returncode
+        self.proc = None
+        if returncode != 0:
+            raise RuntimeError(f"FFmpeg编码失败 (退出代码 {returncode}): {stderr.decode('utf-8', errors='replace')}")
+
+    def abort(self):
+        if self.proc is not None:
+            self.proc.kill()
+            self.proc.communicate()
+            self.proc = None
+
+    def _read_error(self):
+        try:
+            self.proc.wait(timeout=5)
+            return self.proc.stderr.read().decode('utf-8', errors='replace')
+        except Exception:
+            return "未知错误"
+
+
+class RawSink(FrameSink):
+    """
+    原始 bgr24 帧直接写入文件（path 为 None 时丢弃），
+    用于在不含编码开销的情况下测量渲染吞吐
+    """
+
+    writes_video = False
+
+    def __init__(self, path, width, height, fps):
+        super().__init__(path, width, height, fps)
+        self.file = None
+
+    def open(self):
+        if self.path:
+            self.file = open(self.path, 'wb')
+        return self
+
+    def write(self, frame):
+        if self.file is not None:
+            self.file.write(memoryview(np.ascontiguousarray(frame)))
+        self.frames_written += 1
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+SINKS = {
+    'cv2': Cv2Sink,
+    'ffmpeg': FfmpegPipeSink,
+    'raw': RawSink,
+}
@@ -1,13 +1,22 @@
 import os
 import cv2
+import itertools
 import time
 import numpy as np
 import tempfile
 import subprocess
 import moviepy.editor as mpy
-from skimage.measure import find_contours
 from PIL import Image
 
+from asset_meta import load_meta, save_meta
+from chroma_key import (
+    IncrementalKeyer, calibrate_key_range, iter_frame_chunks, key_profile,
+    profile_key_range, sample_key_range, sampled_keyer
+)
+
+# 校准键控颜色时采样的帧数
+CALIBRATION_FRAMES = 8
+
 def get_valid_directory():
     while True:
         path = input("请输入要处理的视频目录路径：").strip()
@@ -25,53 +34,31 @@ def print_progress(current, total, start_time, prefix=""):
     print(f"\r{prefix} 进度：{current}/{total} [{progress:.1%}] 已用：{elapsed:.1f}s 剩余：{eta:.1f}s", end="")
 
 def get_background_hsv(frame, sample_size=100):
-    sample = frame[:sample_size, :sample_size]
-    hsv = cv2.cvtColor(sample, cv2.COLOR_BGR2HSV)
-    
-    h = hsv[:,:,0].flatten()
-    s = hsv[:,:,1].flatten()
-    v = hsv[:,:,2].flatten()
-    
-    return (
-        max(0, np.percentile(h, 5) - 5),
-        max(0, np.percentile(s, 5) - 10),
-        max(0, np.percentile(v, 5) - 10),
-        min(180, np.percentile(h, 95) + 5),
-        min(255, np.percentile(s, 95) + 10),
-        min(255, np.percentile(v, 95) + 10)
-    )
+    return sample_key_range(frame, sample_size)
 
 def create_alpha_channel(frame, bg_hsv_range):
-    hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
-    
-    lower = np.array([bg_hsv_range[0], bg_hsv_range[1], bg_hsv_range[2]])
-    upper = np.array([bg_hsv_range[3], bg_hsv_range[4], bg_hsv_range[5]])
-    
-    mask = cv2.inRange(hsv, lower, upper)
-    
-    kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (5,5))
-    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel, iterations=2)
-    mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel, iterations=1)
-    
-    # 消除绿边
-    dilate_kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (30,30))
-    mask = cv2.dilate(mask, dilate_kernel, iterations=1)
-    
-    # 平滑边缘
-    mask = cv2.GaussianBlur(mask, (7,7), 0)
-    
-    return cv2.bitwise_not(mask)
+    return sampled_keyer(bg_hsv_range).alpha(frame).copy()
 
 def find_content_boundary(alpha):
-    contours = find_contours(alpha > 127)
-    if not contours:
+    # 与 skimage find_contours(alpha > 127) 所有轮廓点的外接框一致：
+    # 轮廓点落在相邻两像素（一个前景一个背景）的中点上，
+    # 左右相邻的跳变给出 x=c+0.5、y=r，上下相邻的跳变给出 x=c、y=r+0.5
+    mask = alpha > 127
+    h_edges = mask[:, 1:] != mask[:, :-1]
+    v_edges = mask[1:, :] != mask[:-1, :]
+    h_rows = np.flatnonzero(h_edges.any(axis=1))
+    h_cols = np.flatnonzero(h_edges.any(axis=0))
+    v_rows = np.flatnonzero(v_edges.any(axis=1))
+    v_cols = np.flatnonzero(v_edges.any(axis=0))
+    if h_rows.size == 0 and v_rows.size == 0:
         return None
-    all_points = np.vstack(contours)
+    xs = np.concatenate([h_cols[[0, -1]] + 0.5 if h_cols.size else [], v_cols[[0, -1]] if v_cols.size else []])
+    ys = np.concatenate([h_rows[[0, -1]] if h_rows.size else [], v_rows[[0, -1]] + 0.5 if v_rows.size else []])
     padding = 5
-    x_min = max(0, np.min(all_points[:,1]) - padding)
-    y_min = max(0, np.min(all_points[:,0]) - padding)
-    x_max = min(alpha.shape[1], np.max(all_points[:,1]) + padding)
-    y_max = min(alpha.shape[0], np.max(all_points[:,0]) + padding)
+    x_min = max(0, xs.min() - padding)
+    y_min = max(0, ys.min() - padding)
+    x_max = min(alpha.shape[1], xs.max() + padding)
+    y_max = min(alpha.shape[0], ys.max() + padding)
     return (x_min, y_min, x_max, y_max)
 
 def safe_save_png(image_array, output_path):
@@ -94,7 +81,7 @@ def safe_save_png(image_array, output_path):
         print(f"错误信息：{str(e)}")
         return False
 
-def process_video(input_path, output_dir):
+def process_video(input_path, output_dir, fast_dilate=False, chunk_size=16, key_tolerance=None):
     try:
         start_time = time.time()
         print(f"\n{'='*40}")
@@ -118,31 +105,49 @@ def process_video(input_path, output_dir):
         audio_path = os.path.join(video_output_dir, "audio.wav")
 
         with tempfile.TemporaryDirectory() as temp_dir:
-            # 分析绿幕颜色范围
+            # 分析绿幕颜色范围：沿用素材已校准的参数，否则从多帧边框校准，失败时采样首帧左上角
             first_frame = clip.get_frame(0)
-            bg_hsv_range = get_background_hsv(first_frame)
+            profile = load_meta(video_output_dir).get('key_profile')
+            bg_hsv_range = profile_key_range(profile)
+            if bg_hsv_range is None:
+                times = np.linspace(0, max(0, clip.duration - 1 / fps), num=CALIBRATION_FRAMES)
+                bg_hsv_range = calibrate_key_range([clip.get_frame(t) for t in times])
+                profile = key_profile(bg_hsv_range, "calibrated") if bg_hsv_range else None
+            if bg_hsv_range is None:
+                bg_hsv_range = get_background_hsv(first_frame)
+                profile = key_profile(bg_hsv_range, "sampled")
             print(f"背景HSV范围: H({bg_hsv_range[0]:.0f}-{bg_hsv_range[3]:.0f}) "
                   f"S({bg_hsv_range[1]:.0f}-{bg_hsv_range[4]:.0f}) "
                   f"V({bg_hsv_range[2]:.0f}-{bg_hsv_range[5]:.0f})")
 
             print("[1/3] 分析内容边界...")
-            temp_frame_dir = os.path.join(temp_dir, "frames")
-            os.makedirs(temp_frame_dir, exist_ok=True)
+            # 抠像后的整帧直接写入磁盘上的 .npy 内存映射，不再经过 PNG 压缩/解压
+            frame_h, frame_w = first_frame.shape[:2]
+            temp_frames = np.lib.format.open_memmap(
+                os.path.join(temp_dir, "frames.npy"), mode='w+',
+                dtype=np.uint8, shape=(total_frames, frame_h, frame_w, 4)
+            )
+            frame_count = 0
             boundaries = []
             
-            for i, frame in enumerate(clip.iter_frames(dtype=np.uint8)):
-                alpha = create_alpha_channel(frame, bg_hsv_range)
-                rgba = cv2.cvtColor(frame, cv2.COLOR_BGR2BGRA)
-                rgba[:, :, 3] = alpha
-                
-                temp_path = os.path.join(temp_frame_dir, f"frame_{i:05d}.png")
-                if not cv2.imwrite(temp_path, rgba):
-                    raise RuntimeError(f"无法写入临时帧: {temp_path}")
+            # 按块抠像，fast_dilate 时 30x30 膨胀在缩小 4 倍的掩码上进行
+            keyer = sampled_keyer(bg_hsv_range, fast_dilate_scale=4 if fast_dilate else 1)
+            # key_tolerance 不为 None 时增量抠像，只重抠变化超过该值的图块
+            if key_tolerance is not None:
+                keyer = IncrementalKeyer(keyer, tolerance=key_tolerance)
+            frames = itertools.islice(clip.iter_frames(dtype=np.uint8), total_frames)
+            for start, chunk in iter_frame_chunks(frames, chunk_size):
+                stop = start + len(chunk)
+                rgba = temp_frames[start:stop]
+                rgba[..., :3] = chunk
+                rgba[..., 3] = keyer.alpha(chunk)
+                frame_count = stop
                 
-                bounds = find_content_boundary(alpha)
-                if bounds:
-                    boundaries.append(bounds)
-                print_progress(i+1, total_frames, start_time, "边界分析")
+                for alpha in rgba[..., 3]:
+                    bounds = find_content_boundary(alpha)
+                    if bounds:
+                        boundaries.append(bounds)
+                print_progress(stop, total_frames, start_time, "边界分析")
 
             if not boundaries:
                 raise ValueError("未检测到有效内容区域")
@@ -156,16 +161,13 @@ def process_video(input_path, output_dir):
             print(f"\n裁切区域: X:{crop_x} Y:{crop_y} W:{crop_w} H:{crop_h}")
 
             print("[2/3] 生成最终PNG序列...")
+            written = 0  # 成功写出的帧数，与 frame_count 相同时帧文件从 0 连续编号
             for i in range(total_frames):
-                temp_path = os.path.join(temp_frame_dir, f"frame_{i:05d}.png")
-                if not os.path.exists(temp_path):
-                    print(f"\n警告：缺失帧 {temp_path}")
+                if i >= frame_count:
+                    print(f"\n警告：缺失帧 {i}")
                     continue
                 
-                img = cv2.imread(temp_path, cv2.IMREAD_UNCHANGED)
-                if img is None:
-                    print(f"\n错误：无法读取帧 {temp_path}")
-                    continue
+                img = temp_frames[i]
                 
                 if img.size == 0:
                     print(f"\n错误：空图像数据在帧 {i}")
@@ -199,10 +201,26 @@ def process_video(input_path, output_dir):
                 canvas[y_offset:y_offset+new_height, x_offset:x_offset+new_width] = resized
 
                 output_path = os.path.join(png_dir, f"{i:05d}.png")
-                if not safe_save_png(canvas, output_path):
+                if safe_save_png(canvas, output_path):
+                    written += 1
+                else:
                     print(f"\n错误：无法保存 {output_path}")
                 print_progress(i+1, total_frames, start_time, "PNG生成")
 
+            # 记录键控参数与裁切区域，输出帧已带 alpha，渲染时不再键控
+            meta = {
+                "keyed": True,
+                "key_profile": profile,
+                "crop": {"x": crop_x, "y": crop_y, "width": crop_w, "height": crop_h},
+                "source_size": [frame_w, frame_h],
+                "fps": fps,
+                "frame_count": frame_count,
+            }
+            # 有帧写出失败时编号不连续，不记录命名格式，素材索引会列目录
+            if written == frame_count:
+                meta["png_format"] = "{:05d}.png"
+            save_meta(video_output_dir, meta)
+
             print("\n[3/3] 提取音频...")
             if clip.audio is not None:
                 subprocess.run([
@@ -215,6 +233,9 @@ def process_video(input_path, output_dir):
                 print(f"音频已保存至 {audio_path}")
             else:
                 print("未检测到音频轨道，跳过音频提取")
+            
+            # 先释放内存映射，临时目录才能被删除（Windows）
+            temp_frames = img = cropped = None
 
         print(f"\n处理完成！输出目录：{video_output_dir}")
         print(f"总耗时: {time.time()-start_time:.1f}秒")
@@ -2,6 +2,8 @@ import re
 import json
 import requests
 
+from api_client import get_client
+
 def get_script():
     try:
         with open('config.json', 'r') as f:
@@ -67,7 +69,12 @@ def get_script():
                         "temperature": 0.7
                     }
                 }
-                response = requests.post(API_URL, json=payload, headers=headers, timeout=300)
+                # 429/5xx 由客户端退避重试，其余错误交给下面的人工确认
+                # 单次请求最长 300 秒，超时不再自动重试
+                client = get_client("gemini", rate=1.0, burst=2, pool_size=1, retry_timeouts=False)
+                started = client.snapshot()
+                response = client.post(API_URL, json=payload, headers=headers, timeout=300)
+                print(f"[网络] gemini: {client.stats(since=started)}")
                 
                 if response.status_code == 200:
                     result = response.json()
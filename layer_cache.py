@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""
+静态图层缓存
+标题栏、字幕等在一个场景内不会变化的图层只渲染一次，
+裁剪到包围盒后以预乘图层的形式缓存，按 LRU 淘汰
+"""
+
+from collections import OrderedDict
+
+from compositor import layer_from_rgba
+
+
+def font_key(font):
+    """字体对象不可直接比较，用 (路径, 字号) 作为缓存键的一部分"""
+    return (getattr(font, 'path', None) or id(font), getattr(font, 'size', None))
+
+
+def crop_layer(canvas):
+    """
+    将整幅透明画布裁剪到非透明区域并转换为预乘图层
+    画布全透明时返回 None
+    """
+    bbox = canvas.getbbox()
+    if bbox is None:
+        return None
+    return layer_from_rgba(canvas.crop(bbox), (bbox[0], bbox[1]))
+
+
+class LayerCache:
+    """
+    图层 LRU 缓存
+    键由调用方构造，通常为 (类型, 文字, 位置, 前景尺寸, 字体, 画布尺寸)
+    """
+
+    def __init__(self, max_entries=128):
+        self.max_entries = max_entries
+        self._layers = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, render):
+        """
+        命中时直接返回缓存图层；
+        未命中时调用 render() 生成整幅画布，裁剪后存入缓存
+        """
+        if key in self._layers:
+            self._layers.move_to_end(key)
+            self.hits += 1
+            return self._layers[key]
+
+        self.misses += 1
+        layer = crop_layer(render())
+        self._layers[key] = layer
+        if len(self._layers) > self.max_entries:
+            self._layers.popitem(last=False)
+        return layer
+
+    def clear(self):
+        self._layers.clear()
+
+    def __len__(self):
+        return len(self._layers)
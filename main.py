@@ -1,41 +1,121 @@
 import os
 import json
 import textwrap
-import requests
 import numpy as np
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image, ImageDraw
 import cv2
 import subprocess
-from pydub import AudioSegment
 import tempfile
 import io
 import re
+import time
 from time import sleep
 from get_script import get_script
+from background_prefetch import BackgroundFetcher, prefetch
+from layer_cache import font_key
+from compositor import FrameCompositor, layer_from_rgba, union_rect
+from parallel_render import render_frames_parallel
+from frame_sinks import SINKS, Cv2Sink, FfmpegPipeSink, RawSink
+from asset_reader import VideoAssetReader, PngSequenceReader, decode_spec
+from asset_pack import PACK_FILE, PackedAssetReader
+from asset_meta import load_meta
+from chroma_key import profile_key_range
+from timeline import Timeline
+from profiler import NullProfiler, RenderProfiler
+from audio_mixer import AudioMixer
+from render_caches import RenderCaches
+
+def sprite_bounds(bbox, source_size, size):
+    """
+    源帧 alpha 包围盒缩放到精灵尺寸后的范围 (x0, y0, x1, y1)，没有包围盒时为整个精灵
+    按 Lanczos 的支撑半径（3 个源像素，放大时为 3 个目标像素）外扩，范围外缩放后的 alpha 必为 0
+    """
+    width, height = size
+    if bbox is None:
+        return (0, 0, width, height)
+    bx0, by0, bx1, by1 = bbox
+    if bx0 >= bx1 or by0 >= by1:
+        return (0, 0, 0, 0)
+    sx, sy = width / source_size[0], height / source_size[1]
+    mx, my = int(np.ceil(3 * max(sx, 1))) + 1, int(np.ceil(3 * max(sy, 1))) + 1
+    return (max(0, int(np.floor(bx0 * sx)) - mx), max(0, int(np.floor(by0 * sy)) - my),
+            min(width, int(np.ceil(bx1 * sx)) + mx), min(height, int(np.ceil(by1 * sy)) + my))
+
 
 class VideoGenerator:
-    def __init__(self, script_json, title, output_dir="output", fps=24, resolution=(1080, 1440), pexels_api_key=None):
+    def __init__(self, script_json, title, output_dir="output", fps=24, resolution=(1080, 1440), pexels_api_key=None,
+                 workers=1, temp_dir=None, sink="ffmpeg", sprite_cache_mb=512,
+                 background_cache_dir="cache/backgrounds", pexels_api_url="https://api.pexels.com/v1/search",
+                 profile=False, mix_all_audio=False, caches=None, refresh_catalogue=True,
+                 reader_pool_size=16, reader_cache_mb=1024, prefetch_workers=8,
+                 failed_backgrounds=None, backgrounds=None):
         self.script = json.loads(script_json) if isinstance(script_json, str) else script_json
         self.title = self._sanitize_filename(title)
         self.output_dir = os.path.join(output_dir, self.title)
         self.output_path = os.path.join(self.output_dir, "output.mp4")
+        self.result_path = None  # 生成完成后为实际写出的文件（raw 后端不写 output_path）
+        self.network_stats = None  # 生成完成后为本次（主进程内）背景下载的网络统计
         self.fps = fps
         self.width, self.height = resolution
+        self.timeline = Timeline(self.script, fps)  # 帧 -> 场景计划
         self.pexels_api_key = pexels_api_key
-        self.temp_dir = tempfile.mkdtemp()
-        self.video_clips = {}
+        self.pexels_api_url = pexels_api_url  # 测试时可指向本地替身服务器
+        self.prefetch_workers = prefetch_workers  # 背景预取的并发下载数，0 表示不预取（并行渲染时仍逐张预取）
+        self.background_fetcher = BackgroundFetcher(pexels_api_key, pexels_api_url, pool_size=max(1, prefetch_workers))
+        self.failed_backgrounds = set(failed_backgrounds or ())  # 预取失败的搜索词，渲染时不再重试
+        self.workers = max(1, workers)
+        if sink not in SINKS:
+            raise ValueError(f"未知的输出后端: {sink}，可选: {', '.join(SINKS)}")
+        self.sink = sink
+        self.temp_dir = temp_dir or tempfile.mkdtemp()
+        self.profiler = RenderProfiler() if profile else NullProfiler()
+        self.mix_all_audio = mix_all_audio  # False 时只混入每个场景第一个前景的音频
+        
+        # 并行渲染时工作进程用同样的参数各自构造生成器，共用主进程的临时目录
+        self.worker_kwargs = {
+            "script_json": self.script,
+            "title": self.title,
+            "output_dir": output_dir,
+            "fps": fps,
+            "resolution": resolution,
+            "pexels_api_key": pexels_api_key,
+            "temp_dir": self.temp_dir,
+            "sprite_cache_mb": sprite_cache_mb,
+            "background_cache_dir": background_cache_dir,
+            "pexels_api_url": pexels_api_url,
+            "profile": profile,
+            "refresh_catalogue": False,
+            "reader_pool_size": reader_pool_size,
+            "reader_cache_mb": reader_cache_mb,
+        }
         
-        self.background_cache_pool = {}  # 图片缓存池
+        # 批量渲染时由调用方传入，多个任务共享同一份缓存
+        self.owns_caches = caches is None
+        self.caches = caches or RenderCaches(
+            sprite_cache_mb, background_cache_dir, refresh_catalogue=refresh_catalogue,
+            reader_pool_size=reader_pool_size, reader_cache_mb=reader_cache_mb
+        )
+        self.catalogue = self.caches.catalogue
+        self.reader_pool = self.caches.reader_pool
+        self.active_plan = None  # 当前场景，切换场景时释放它固定的读取器
+        # 帧去重：上一帧的输入指纹，相同则直接复用帧缓冲
+        self.last_fingerprint = None  # None 表示帧缓冲中还没有可复用的帧
+        self.frames_rendered = 0
+        self.frames_reused = 0
+        self.sprite_cache = self.caches.sprite_cache
+        self.layer_cache = self.caches.layer_cache
+        self.background_cache_pool = self.caches.background_cache_pool  # 图片缓存池
+        self.background_disk_cache = self.caches.background_disk_cache
+        # 并行渲染的工作进程由主进程交出已预取的背景（搜索词 -> BGR 数组）
+        for query, img in (backgrounds or {}).items():
+            self.background_cache_pool[(query, self.width, self.height)] = img
+        self.pcm_cache = self.caches.pcm_cache  # 素材音频只解析一次
         self.cache_log_recorder = set()  # 缓存日志
+        self.compositor = FrameCompositor(self.width, self.height)  # 预分配的帧缓冲
         
         # 初始化字体
-        try:
-            self.subtitle_font = ImageFont.truetype("font.ttf", 60)
-            self.title_font = ImageFont.truetype("font.ttf", 70)
-        except IOError:
-            self.subtitle_font = ImageFont.load_default(size=60)
-            self.title_font = ImageFont.load_default(size=70)
-            print("警告：未找到 font.ttf，使用默认字体替代")
+        self.subtitle_font = self.caches.font(60)
+        self.title_font = self.caches.font(70)
         
         # 创建输出目录
         os.makedirs(self.output_dir, exist_ok=True)
@@ -48,122 +128,169 @@ class VideoGenerator:
         return sanitized[:50].strip()
 
     def download_background(self, query):
-        if not self.pexels_api_key:
-            raise ValueError("需要Pexels API密钥")
-
-        # 缓存命中判断
-        if query in self.background_cache_pool:
+        # 缓存命中判断，共享缓存中可能有其他分辨率的同名背景
+        pool_key = (query, self.width, self.height)
+        if pool_key in self.background_cache_pool:
+            self.profiler.count("background_cache_pool.hit")
             # 首次命中时打印日志
             if query not in self.cache_log_recorder:
                 print(f"[缓存命中] 背景图片: {query}")
                 self.cache_log_recorder.add(query)
-            return self.background_cache_pool[query]
-            
-        print(f"[开始下载] 背景图片: {query}")
-        headers = {"Authorization": self.pexels_api_key}
-        url = f"https://api.pexels.com/v1/search?query={query}&per_page=1&orientation=portrait"
+            return self.background_cache_pool[pool_key]
+        self.profiler.count("background_cache_pool.miss")
+        
+        # 磁盘缓存中已是缩放好的帧，无需联网
+        if self.background_disk_cache:
+            img = self.background_disk_cache.get(query, (self.width, self.height))
+            self.profiler.count("background_disk_cache.hit" if img is not None else "background_disk_cache.miss")
+            if img is not None:
+                print(f"[磁盘缓存命中] 背景图片: {query}")
+                self.background_cache_pool[pool_key] = img
+                return img
+        
+        if query in self.failed_backgrounds:
+            return None
+        
+        # 未预取到的背景在此同步下载，重试与限速由 api_client 处理
+        content = self.background_fetcher.fetch(query)
+        if content is None:
+            self.failed_backgrounds.add(query)
+            return None
+        return self.store_background(query, content)
 
-        max_retries = 10
-        for retry in range(max_retries):
+    def store_background(self, query, content):
+        """解码、缩放下载的背景原图并写入内存与磁盘缓存，可在线程池中调用"""
+        img = Image.open(io.BytesIO(content)).convert("RGBA")
+        img = self._process_image(img)
+        
+        # 更新缓存
+        self.background_cache_pool[(query, self.width, self.height)] = img
+        if self.background_disk_cache:
             try:
-                response = requests.get(url, headers=headers, timeout=10)
-                response.raise_for_status()
-                data = response.json()
-                
-                if not data.get("photos"):
-                    raise Exception(f"未找到相关图片: {query}")
-                    
-                # 获取质量最佳的图片
-                photo_url = data["photos"][0]["src"]["original"]
-                
-                # 下载图片
-                img_response = requests.get(photo_url, timeout=15)
-                img_response.raise_for_status()
-                
-                # 处理图片
-                img = Image.open(io.BytesIO(img_response.content)).convert("RGBA")
-                img = self._process_image(img)
-                
-                # 更新缓存
-                self.background_cache_pool[query] = img
-                print(f"[下载成功] 背景图片: {query} (第{retry+1}次尝试)")
-                
-                sleep(1 if retry == 0 else 2**retry)
-                return img
-                
+                self.background_disk_cache.put(query, (self.width, self.height), img)
             except Exception as e:
-                print(f"[下载失败] 第{retry+1}次尝试: {str(e)}")
-                if retry == max_retries - 1:
-                    print(f"[警告] 使用黑色背景替代: {query}")
-                    return Image.new("RGBA", (self.width, self.height), (0,0,0,255))
-                sleep(3)
+                print(f"[警告] 背景写入磁盘缓存失败: {str(e)}")
+        return img
+
+    def prefetch_backgrounds(self):
+        """
+        渲染前并发下载剧本中所有尚未缓存的背景并缩放好，渲染循环不再等待网络
+        并行渲染时即使关闭了预取也在主进程中先下载，避免每个工作进程各自联网（见 parallel_kwargs）
+        """
+        resolution = (self.width, self.height)
+        queries = []
+        for scene in self.script:
+            query = scene.get('background_image')
+            if not query or query in queries or (query, self.width, self.height) in self.background_cache_pool:
+                continue
+            if self.background_disk_cache and self.background_disk_cache.contains(query, resolution):
+                continue
+            queries.append(query)
+        fetch_workers = min(self.prefetch_workers or (1 if self.workers > 1 else 0), len(queries))
+        if not fetch_workers or not self.pexels_api_key:
+            return
+        
+        print(f"[背景预取] {len(queries)} 张背景，{fetch_workers} 个并发下载")
+        started = time.time()
+        done, failed = prefetch(
+            queries, self.background_fetcher.fetch, self.store_background, fetch_workers=fetch_workers
+        )
+        self.failed_backgrounds.update(failed)
+        print(f"[背景预取] 完成 {len(done)} 张，失败 {len(failed)} 张，耗时 {time.time() - started:.1f}s")
+
+    def parallel_kwargs(self):
+        """
+        工作进程的构造参数：带上预取失败的搜索词，工作进程不再重试；
+        没有磁盘缓存时把本剧本已预取的背景数组一并交出，工作进程无需重新下载
+        """
+        kwargs = dict(self.worker_kwargs, failed_backgrounds=set(self.failed_backgrounds))
+        if not self.background_disk_cache:
+            queries = {scene.get('background_image') for scene in self.script}
+            kwargs["backgrounds"] = {
+                query: img for (query, width, height), img in self.background_cache_pool.items()
+                if query in queries and (width, height) == (self.width, self.height)
+            }
+        return kwargs
 
     def _process_image(self, img):
         # 修改尺寸
         if img.size != (self.width, self.height):
             img = img.resize((self.width, self.height), Image.LANCZOS)
 
-        img = img.convert("RGB")
-        return img.convert("RGBA")
-
-    def load_asset_frame(self, fg, frame_number):
-        from moviepy.editor import VideoFileClip
-        from moviepy.video.fx import all as vfx
-
-        asset_id = fg['id']
-        asset_path = os.path.join("./memes", asset_id)
-        
-        # 优先寻找视频文件
-        video_file_path = None
-        if os.path.isdir(asset_path):
-            video_extensions = ['.mp4', '.mov', '.avi', '.mkv']
-            video_file_path_candidates = [os.path.join(asset_path, f) for f in os.listdir(asset_path) if any(f.lower().endswith(ext) for ext in video_extensions)]
-            if video_file_path_candidates:
-                video_file_path = video_file_path_candidates[0]
-
-        if video_file_path:
-            if asset_id not in self.video_clips:
-                clip = VideoFileClip(video_file_path)
-                # 处理绿幕
-                if 'mask_color' in fg:
-                    try:
-                        mask_color = tuple(fg['mask_color'])
-                        # 使用更安全的参数
-                        clip = clip.fx(vfx.mask_color, color=mask_color, thr=fg.get('mask_thr', 20), s=fg.get('mask_s', 5))
-                    except Exception as e:
-                        print(f"绿幕处理失败 for {asset_id}: {e}")
-                self.video_clips[asset_id] = clip
-
-            clip = self.video_clips[asset_id]
-            
-            frame_time = frame_number / self.fps
-            
-            # 循环播放
-            if clip.duration and frame_time >= clip.duration:
-                frame_time = frame_time % clip.duration
-            elif not clip.duration: # 处理单帧视频或图片
-                frame_time = 0
-
-            video_frame = clip.get_frame(frame_time)
-            return Image.fromarray(video_frame).convert("RGBA")
-
-        # 如果没有视频，则回退到PNG序列
-        png_dir = os.path.join(asset_path, "png")
-        if os.path.exists(png_dir):
-            asset_frame = int(frame_number * (60 / self.fps))
-            frame_file = f"{asset_frame:05d}.png"
-            frame_path = os.path.join(png_dir, frame_file)
-
-            if not os.path.exists(frame_path):
-                png_files = sorted([f for f in os.listdir(png_dir) if f.endswith('.png')])
-                if png_files:
-                    frame_path = os.path.join(png_dir, png_files[-1])
-                else:
-                    raise FileNotFoundError(f"素材帧缺失: {asset_id}")
-            
-            return Image.open(frame_path).convert("RGBA")
-            
-        raise FileNotFoundError(f"找不到素材 '{asset_id}' 的视频文件或PNG序列")
+        # 以 BGR 数组缓存，合成时直接拷入帧缓冲
+        return cv2.cvtColor(np.array(img.convert("RGB")), cv2.COLOR_RGB2BGR)
+
+    def get_asset_reader(self, fg):
+        """
+        从读取器池取出并固定前景的读取器，返回 (键, 读取器)，用完后需 reader_pool.release(键)
+        每个素材 + 键控参数在池中只定位、解码一次
+        """
+        spec = decode_spec(fg)
+        # 读取器内的帧映射与输出帧率有关
+        key = (fg['id'], spec, self.fps)
+        evictions = self.reader_pool.evictions
+        if key in self.reader_pool:
+            self.profiler.count("asset_readers.hit")
+            reader = self.reader_pool.acquire(key, None)
+        else:
+            self.profiler.count("asset_readers.miss")
+            with self.profiler.stage("asset_decode"):
+                reader = self.reader_pool.acquire(key, lambda: self._open_asset_reader(fg['id'], spec))
+        if self.reader_pool.evictions != evictions:
+            self.profiler.count("asset_readers.evict", self.reader_pool.evictions - evictions)
+        return key, reader
+
+    def _open_asset_reader(self, asset_id, spec):
+        # 帧来源由素材索引决定（已抠像的帧 > 视频 > 打包帧 > PNG 序列），不扫描目录
+        entry = self.catalogue.get(asset_id)
+        if not entry or not entry.get("kind"):
+            raise FileNotFoundError(f"找不到素材 '{asset_id}' 的视频文件或PNG序列")
+        asset_path = self.catalogue.asset_dir(asset_id)
+
+        if entry["kind"] == "video":
+            # 按需顺序解码，循环播放与绿幕键控都已在读取器内处理
+            # 未指定 mask_color 时使用素材元数据中校准好的键控范围（如果有）
+            # 每个读取器的帧缓存分得读取器池内存预算的一份，打开的读取器全部缓存满时也不超出预算
+            mask_color, mask_thr, mask_s = spec
+            key_range = None
+            if mask_color is None:
+                key_range = profile_key_range(load_meta(asset_path).get('key_profile'))
+            return VideoAssetReader(
+                os.path.join(asset_path, entry["video"]), self.fps,
+                mask_color=mask_color, mask_thr=mask_thr, mask_s=mask_s, key_range=key_range,
+                cache_mb=self.reader_pool.budget_bytes / self.reader_pool.max_open / (1024 * 1024)
+            )
+
+        # 打包好的帧文件（内存映射，零拷贝取帧）
+        if entry["kind"] == "pack":
+            return PackedAssetReader(os.path.join(asset_path, PACK_FILE), self.fps)
+
+        # PNG序列，文件列表来自索引
+        return PngSequenceReader(
+            os.path.join(asset_path, "png"), self.fps,
+            fps=entry.get("fps") or 60, files=self.catalogue.png_files(asset_id)
+        )
+
+    def get_sprite(self, reader_key, reader, source_index, size):
+        # 同一源帧、同一尺寸只缩放一次
+        misses = self.sprite_cache.misses
+        sprite = self.sprite_cache.get(
+            (reader_key, source_index, size),
+            lambda: self._render_sprite(reader, source_index, size)
+        )
+        self.profiler.count("sprite_cache.miss" if self.sprite_cache.misses != misses else "sprite_cache.hit")
+        return sprite
+
+    def _render_sprite(self, reader, source_index, size):
+        with self.profiler.stage("asset_decode"):
+            asset_img = Image.fromarray(reader.frame(source_index))
+        source_size = asset_img.size
+        with self.profiler.stage("resize"):
+            asset_img = asset_img.resize(size, Image.LANCZOS)
+        with self.profiler.stage("colour_convert"):
+            # 只保留非透明区域，合成时不再处理全透明像素；图层的 x, y 为在精灵框内的偏移
+            x0, y0, x1, y1 = sprite_bounds(reader.bbox(source_index), source_size, size)
+            return layer_from_rgba(np.asarray(asset_img)[y0:y1, x0:x1], (x0, y0))
 
     def generate_title_frame(self):
         title_frame = Image.new("RGBA", (self.width, self.height), (0, 0, 0, 0))
@@ -241,83 +368,178 @@ class VideoGenerator:
         
         return subtitle_frame
 
+    def blend_title(self):
+        with self.profiler.stage("title"):
+            layer = self.get_title_layer()
+        with self.profiler.stage("composite"):
+            self.compositor.blend(layer)
+
+    def get_title_layer(self):
+        # 标题在整个视频中不变，只渲染一次
+        key = ("title", self.title, font_key(self.title_font), (self.width, self.height))
+        return self.layer_cache.get(key, self.generate_title_frame)
+
+    def get_subtitle_layer(self, text, position, fg_size):
+        # 字幕只随场景变化，按 (文字, 位置, 前景尺寸, 字体) 缓存
+        key = (
+            "subtitle", text, (position['x'], position['y']), tuple(fg_size),
+            font_key(self.subtitle_font), (self.width, self.height)
+        )
+        return self.layer_cache.get(key, lambda: self.generate_subtitle_frame(text, position, fg_size))
+
     def extract_audio(self, asset_id, duration):
-        audio_path = os.path.join("./memes", asset_id, "audio.wav")
-        if not os.path.exists(audio_path):
+        # 返回缓存的 int16 PCM 数组视图，截取到 duration 秒
+        entry = self.catalogue.get(asset_id)
+        if not entry or entry.get("audio") != "audio.wav":
             return None
+        audio_path = os.path.join(self.catalogue.asset_dir(asset_id), "audio.wav")
             
-        audio = AudioSegment.from_wav(audio_path)
-        return audio[:duration*1000]  # 精确到毫秒
+        pcm = self.pcm_cache.load(audio_path)
+        return pcm[:int(duration * self.pcm_cache.sample_rate)]
 
-    def generate_frame(self, scene, frame_time):
+    def resolve_scene(self, plan):
+        # 每个场景只解析一次背景、前景读取器和字幕图层，之后逐帧复用
+        scene = plan.scene
         try:
-            bg_image = self.download_background(scene['background_image'])
+            with self.profiler.stage("background"):
+                plan.background = self.download_background(scene['background_image'])
         except Exception as e:
             print(f"背景加载失败: {str(e)}")
-            bg_image = Image.new("RGBA", (self.width, self.height), (0,0,0,255))
-            
-        frame = bg_image.copy()
-        scene_start = scene['start_time']
-        frame_number = int((frame_time - scene_start) * self.fps)
+            plan.background = None
         
-        # 处理所有前景
         for fg in scene['foregrounds']:
             asset_id = fg['id']
             try:
-                # 加载和缩放素材
-                asset_img = self.load_asset_frame(fg, frame_number)
+                reader_key, reader = self.get_asset_reader(fg)
+                plan.reader_keys.append(reader_key)
                 scale_factor = fg['scale'] / 100.0
                 new_size = (int(500*scale_factor), int(500*scale_factor))
-                asset_img = asset_img.resize(new_size, Image.LANCZOS)
-                
-                # 定位中心点
-                x = fg['position']['x'] - new_size[0]//2
-                y = fg['position']['y'] - new_size[1]//2
-                frame.paste(asset_img, (x, y), asset_img)
                 
-                # 处理字幕
+                subtitle_layer = None
                 if 'subtitle' in fg and fg['subtitle']:
-                    subtitle_layer = self.generate_subtitle_frame(
-                        fg['subtitle'],
-                        fg['position'],
-                        new_size
-                    )
-                    frame = Image.alpha_composite(frame, subtitle_layer)
+                    with self.profiler.stage("subtitle"):
+                        subtitle_layer = self.get_subtitle_layer(
+                            fg['subtitle'],
+                            fg['position'],
+                            new_size
+                        )
+                
+                plan.foregrounds.append({
+                    "fg": fg,
+                    "reader_key": reader_key,
+                    "reader": reader,
+                    "size": new_size,
+                    # 定位中心点
+                    "x": fg['position']['x'] - new_size[0]//2,
+                    "y": fg['position']['y'] - new_size[1]//2,
+                    "subtitle": subtitle_layer,
+                    # 场景内逐帧的源帧序号预先算好，逐帧直接查表
+                    "source_indices": reader.source_indices(plan.frame_count(self.fps)),
+                })
             except Exception as e:
                 print(f"[素材异常] {asset_id}: {str(e)}")
+        
+        # 场景内不变的背景、字幕与标题合成为底图，逐帧只重绘前景所在的矩形
+        overlays = [item["subtitle"] for item in plan.foregrounds]
+        with self.profiler.stage("title"):
+            overlays.append(self.get_title_layer())
+        with self.profiler.stage("composite"):
+            plan.base = self.compositor.render_base(plan.background, overlays)
+        plan.dirty_rect = union_rect([
+            self.compositor.layer_rect(item["x"], item["y"], *item["size"]) for item in plan.foregrounds
+        ])
+        plan.resolved = True
+
+    def activate_scene(self, plan):
+        """切换到 plan（空白帧为 None）时释放上一个场景固定的读取器，上一个场景再用到时重新解析"""
+        if plan is self.active_plan:
+            return
+        previous, self.active_plan = self.active_plan, plan
+        if previous is not None:
+            for key in previous.reader_keys:
+                self.reader_pool.release(key)
+            previous.reset()
+
+    def reuse_frame(self, fingerprint):
+        """
+        帧的输入指纹与上一帧相同时返回 True，帧缓冲中仍是上一帧，无需重新合成
+        指纹为 (场景序号, 各前景的源帧序号)：同一场景内背景、前景位置与尺寸、字幕和标题都不变；
+        空白帧的指纹为 ("blank",)
+        """
+        if fingerprint == self.last_fingerprint:
+            self.frames_reused += 1
+            self.profiler.count("frame_dedupe.hit")
+            return True
+        self.last_fingerprint = fingerprint
+        self.frames_rendered += 1
+        self.profiler.count("frame_dedupe.miss")
+        return False
+
+    def generate_frame(self, plan, frame_time):
+        self.activate_scene(plan)
+        if not plan.resolved:
+            self.resolve_scene(plan)
+        frame_number = int((frame_time - plan.start_time) * self.fps)
+        
+        # 先确定各前景的源帧：单帧素材、源帧率低于输出帧率的素材等情况下连续帧的输入完全相同
+        source_indices = []
+        for item in plan.foregrounds:
+            indices = item["source_indices"]
+            if frame_number < len(indices):
+                source_indices.append(int(indices[frame_number]))
+            else:
+                source_indices.append(item["reader"].source_index(frame_number))
+        if self.reuse_frame((plan.index, tuple(source_indices))):
+            return self.compositor.frame
+            
+        with self.profiler.stage("composite"):
+            self.compositor.begin_dirty(plan.base, plan.background, plan.dirty_rect)
+        
+        # 在脏矩形内按原层次重新合成前景、字幕与标题，矩形外保持底图
+        for item, source_index in zip(plan.foregrounds, source_indices):
+            try:
+                sprite = self.get_sprite(item["reader_key"], item["reader"], source_index, item["size"])
+                with self.profiler.stage("composite"):
+                    self.compositor.blend(sprite, item["x"] + sprite.x, item["y"] + sprite.y)
+                    
+                    # 处理字幕
+                    self.compositor.blend(item["subtitle"])
+            except Exception as e:
+                print(f"[素材异常] {item['fg']['id']}: {str(e)}")
                 
-        # 合成标题栏
-        title_layer = self.generate_title_frame()
-        frame = Image.alpha_composite(frame, title_layer)
+        # 合成标题栏（裁剪到脏矩形内）
+        self.blend_title()
         
-        return np.array(frame.convert("RGB"))
+        # 返回的是复用的 BGR 帧缓冲，下一帧会被覆盖
+        return self.compositor.frame
 
-    def merge_audio(self, video_path):
+    def mix_audio(self):
         total_duration = self.script[-1]['end_time']
-        final_audio = AudioSegment.silent(duration=total_duration*1000)
+        mixer = AudioMixer(total_duration, self.pcm_cache.sample_rate, self.pcm_cache.channels)
         
         print("\n==== 开始音频混合 ====")
-        audio_clip_count = 0
         for scene_idx, scene in enumerate(self.script):
             start = scene['start_time']
             scene_duration = scene['end_time'] - start
             print(f"处理场景 {scene_idx+1}/{len(self.script)} (时长: {scene_duration}s)")
             
-            # 只处理第一个素材的音频
             for fg_idx, fg in enumerate(scene['foregrounds']):
-                if fg_idx != 0:
+                # 默认只处理第一个素材的音频
+                if fg_idx != 0 and not self.mix_all_audio:
                     print(f"跳过前景 {fg_idx+1} 的音频（非首个素材）")
                     continue
                     
                 print(f"处理前景 {fg_idx+1} ({fg['id']})...", end='', flush=True)
-                audio_clip = self.extract_audio(fg['id'], scene_duration)
-                if audio_clip:
-                    try:
-                        final_audio = final_audio.overlay(audio_clip, position=int(start*1000))
-                        audio_clip_count += 1
-                        print(f"已添加 {len(audio_clip)}ms 音频")
-                    except Exception as e:
-                        print(f"音频混合失败: {str(e)}")
+                audio_clip = None
+                try:
+                    audio_clip = self.extract_audio(fg['id'], scene_duration)
+                except Exception as e:
+                    print(f"音频读取失败: {str(e)}")
+                    continue
+                if audio_clip is not None and len(audio_clip):
+                    # 每个前景可通过 volume 指定线性增益
+                    added = mixer.add(audio_clip, start, gain=fg.get('volume', 1.0))
+                    print(f"已添加 {added * 1000 // mixer.sample_rate}ms 音频")
                 else:
                     print("无可用音频")
         
@@ -333,7 +555,7 @@ class VideoGenerator:
             max_export_retries = 3
             for retry in range(max_export_retries):
                 try:
-                    final_audio.export(audio_path, format="wav")
+                    mixer.write_wav(audio_path)
                     if os.path.exists(audio_path) and os.path.getsize(audio_path) > 1024:
                         print(f"音频导出成功 ({os.path.getsize(audio_path)//1024}KB)")
                         break
@@ -351,6 +573,11 @@ class VideoGenerator:
                 os.remove(audio_path)
             raise
         
+        return audio_path
+
+    def merge_audio(self, video_path):
+        audio_path = self.mix_audio()
+        
         # 测试视频存在
         if not os.path.exists(video_path):
             raise FileNotFoundError(f"视频文件丢失: {video_path}")
@@ -470,45 +697,96 @@ class VideoGenerator:
             
             raise
 
-    def generate_video(self):
-        total_duration = self.script[-1]['end_time']
-        total_frames = int(total_duration * self.fps)
+    def render_frame(self, frame_idx):
+        self.profiler.begin_frame(frame_idx)
+        with self.profiler.stage("scene_lookup"):
+            plan = self.timeline.plan_for_frame(frame_idx)
+            self.activate_scene(plan)
+        if plan:
+            frame = self.generate_frame(plan, frame_idx / self.fps)
+        elif self.reuse_frame(("blank",)):
+            frame = self.compositor.frame
+        else:
+            # 处理空白帧
+            frame = self.compositor.begin()
+            self.blend_title()
+        self.profiler.end_frame()
+        return frame
+
+    def iter_frames(self, total_frames):
+        # 按顺序产出所有帧 (BGR)
+        if self.workers > 1:
+            print(f"[并行渲染] {self.workers} 个工作进程")
+            # 工作进程对重复帧只回传标记，重复帧以同一个数组对象产出
+            previous = None
+            for frame in render_frames_parallel(
+                self.parallel_kwargs(), total_frames, self.workers, chunk_size=self.fps,
+                on_profile=self.profiler.absorb if self.profiler.enabled else None
+            ):
+                if frame is previous:
+                    self.frames_reused += 1
+                else:
+                    self.frames_rendered += 1
+                previous = frame
+                yield frame
+        else:
+            for frame_idx in range(total_frames):
+                yield self.render_frame(frame_idx)
+
+    def create_sink(self):
+        if self.sink == "ffmpeg":
+            # 先混音，编码时直接封装音轨，省去临时视频和二次编码
+            audio_path = self.mix_audio()
+            return FfmpegPipeSink(self.output_path, self.width, self.height, self.fps, audio_path=audio_path)
+        if self.sink == "raw":
+            raw_path = os.path.join(self.output_dir, f"output_{self.width}x{self.height}_bgr24.raw")
+            return RawSink(raw_path, self.width, self.height, self.fps)
         temp_video = os.path.join(self.temp_dir, "temp_video.mp4")
+        return Cv2Sink(temp_video, self.width, self.height, self.fps)
+
+    def generate_video(self):
+        total_frames = self.timeline.total_frames
+        # 客户端在进程内共享（批量渲染的多个任务共用），只统计本次生成期间的请求
+        network_started = self.background_fetcher.client.snapshot()
         
-        # 初始化 writer
-        writer = cv2.VideoWriter(
-            temp_video,
-            cv2.VideoWriter_fourcc(*'mp4v'),
-            self.fps,
-            (self.width, self.height)
-        )
+        try:
+            self.prefetch_backgrounds()
+            sink = self.create_sink()
+            with sink:
+                for frame_idx, frame in enumerate(self.iter_frames(total_frames)):
+                    with self.profiler.stage("encode", frame_idx):
+                        sink.write(frame)
+        finally:
+            # 无论成功与否都释放最后一个场景固定的读取器，批量渲染中失败的任务不会一直占着共享的读取器池；
+            # 缓存由本生成器创建时一并关闭
+            self.activate_scene(None)
+            if self.profiler.enabled:
+                print(f"[素材读取器] {self.reader_pool.stats()}")
+            if self.owns_caches:
+                self.caches.close()
         
-        # 逐帧生成
-        for frame_idx in range(total_frames):
-            current_time = frame_idx / self.fps
-            current_scene = next(
-                (s for s in self.script if s['start_time'] <= current_time < s['end_time']),
-                None
-            )
-            
-            if current_scene:
-                frame = self.generate_frame(current_scene, current_time)
-            else:
-                # 处理空白帧
-                frame = np.zeros((self.height, self.width, 3), dtype=np.uint8)
-                title_layer = self.generate_title_frame()
-                frame_pil = Image.fromarray(frame).convert("RGBA")
-                frame = np.array(Image.alpha_composite(frame_pil, title_layer).convert("RGB"))
-                
-            writer.write(cv2.cvtColor(frame, cv2.COLOR_RGB2BGR))
-            
-        writer.release()
-        self.merge_audio(temp_video)
+        if total_frames:
+            print(f"[帧去重] 复用 {self.frames_reused}/{total_frames} 帧 "
+                  f"({self.frames_reused / total_frames:.1%})")
+        self.network_stats = self.background_fetcher.client.stats(since=network_started)
+        if self.network_stats["requests"]:
+            print(f"[网络] pexels: {self.network_stats}")
+        
+        # 只写了画面的后端输出的是临时视频，再合成音轨写到 output_path
+        if sink.writes_video and not sink.muxes_audio:
+            self.merge_audio(sink.path)
+            self.result_path = self.output_path
+        else:
+            self.result_path = sink.path
+        
+        if self.profiler.enabled:
+            self.profiler.print_summary(self.profiler.write_report(self.output_dir))
+            print(f"[性能分析] 报告已写入: {self.output_dir}")
         
         # 清理临时文件
         import shutil
         shutil.rmtree(self.temp_dir)
-        print(f"[生成完成] 输出文件: {self.output_path}")
+        print(f"[生成完成] 输出文件: {self.result_path}")
 
 if __name__ == "__main__":
     import argparse
@@ -516,6 +794,18 @@ if __name__ == "__main__":
     # 解析命令行参数
     parser = argparse.ArgumentParser(description='生成视频')
     parser.add_argument('--script', help='指定剧本JSON文件路径')
+    parser.add_argument('--batch', help='批量渲染：JSONL 任务文件路径，每行一个任务')
+    parser.add_argument('--manifest', help='批量渲染结果清单路径（默认 output/batch_manifest.jsonl）')
+    parser.add_argument('--procs', type=int, default=1, help='批量渲染时并行处理任务的进程数')
+    parser.add_argument('--workers', type=int, default=1, help='并行渲染的进程数')
+    parser.add_argument('--sprite-cache-mb', type=int, default=512, help='前景精灵缓存的内存预算 (MB)')
+    parser.add_argument('--reader-pool-size', type=int, default=16, help='同时打开的素材读取器上限，超出时关闭最久未用的')
+    parser.add_argument('--reader-cache-mb', type=int, default=1024, help='素材读取器解码帧的内存预算 (MB)')
+    parser.add_argument('--prefetch-workers', type=int, default=8, help='渲染前并发下载背景的线程数，0 表示不预取（并行渲染时仍逐张预取）')
+    parser.add_argument('--profile', action='store_true', help='记录各渲染阶段耗时并输出性能报告')
+    parser.add_argument('--mix-all-audio', action='store_true', help='混入每个场景所有前景的音频（默认只混入第一个）')
+    parser.add_argument('--sink', choices=['ffmpeg', 'cv2', 'raw'], default='ffmpeg',
+                        help='帧输出后端：ffmpeg 管道直接编码并封装音频 / cv2 临时文件后合成 / raw 原始帧')
     args = parser.parse_args()
     
     # 从配置文件读取 API 密钥
@@ -533,6 +823,28 @@ if __name__ == "__main__":
         print("错误：config.json 中缺少 pexels_api_key 字段")
         exit()
 
+    generator_options = {
+        "output_dir": "output",
+        "pexels_api_key": pexels_api_key,
+        "pexels_api_url": config.get("pexels_api_url", "https://api.pexels.com/v1/search"),
+        "background_cache_dir": config.get("background_cache_dir", "cache/backgrounds"),
+        "workers": args.workers,
+        "sink": args.sink,
+        "sprite_cache_mb": args.sprite_cache_mb,
+        "reader_pool_size": args.reader_pool_size,
+        "reader_cache_mb": args.reader_cache_mb,
+        "prefetch_workers": args.prefetch_workers,
+        "profile": args.profile,
+        "mix_all_audio": args.mix_all_audio,
+    }
+
+    # 批量渲染：长驻进程内依次处理任务，共享缓存
+    if args.batch:
+        from batch_render import run_batch
+        manifest_path = args.manifest or os.path.join("output", "batch_manifest.jsonl")
+        run_batch(args.batch, manifest_path, generator_options, procs=args.procs)
+        exit()
+
     # 获取剧本和标题
     if args.script:
         # 使用指定的剧本文件
@@ -556,10 +868,5 @@ if __name__ == "__main__":
         script_data = result["script"]
         video_title = result["title"]
     
-    generator = VideoGenerator(
-        script_data,
-        title=video_title,
-        output_dir="output",
-        pexels_api_key=pexels_api_key
-    )
+    generator = VideoGenerator(script_data, title=video_title, **generator_options)
     generator.generate_video()
\ No newline at end of file
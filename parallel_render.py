@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+多进程并行渲染
+帧序号按连续区间分片到进程池，每个工作进程持有自己的 VideoGenerator
+（素材解码器、背景缓存等互不共享），主进程按提交顺序取回结果，
+在途分片数有上限，保证内存占用有界；
+与分片内上一帧相同（生成器判定为重复）的帧只回传 None，主进程重复上一帧
+"""
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+# 工作进程内的生成器实例，由 _init_worker 创建
+_worker_generator = None
+
+
+def _init_worker(generator_kwargs):
+    global _worker_generator
+    from main import VideoGenerator
+    _worker_generator = VideoGenerator(**generator_kwargs)
+
+
+def _render_chunk(start, stop):
+    # 帧缓冲会被下一帧覆盖，返回前需要拷贝；分片首帧总是完整回传
+    frames = []
+    for idx in range(start, stop):
+        reused = _worker_generator.frames_reused
+        frame = _worker_generator.render_frame(idx)
+        frames.append(None if frames and _worker_generator.frames_reused != reused else frame.copy())
+    profiler = _worker_generator.profiler
+    return frames, (profiler.drain() if profiler.enabled else None)
+
+
+def render_frames_parallel(generator_kwargs, total_frames, workers, chunk_size=24, max_pending=None, on_profile=None):
+    """
+    并行渲染 [0, total_frames) 内的所有帧，按帧序号顺序逐帧产出
+    max_pending: 同时在途的分片数，默认 workers * 2
+    on_profile: 开启性能分析时，每个分片的计时数据回传给该回调
+    """
+    if max_pending is None:
+        max_pending = workers * 2
+
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(generator_kwargs,)
+    ) as pool:
+        pending = deque()
+        previous = None
+        next_start = 0
+        while next_start < total_frames or pending:
+            # 补满在途队列
+            while next_start < total_frames and len(pending) < max_pending:
+                stop = min(next_start + chunk_size, total_frames)
+                pending.append(pool.submit(_render_chunk, next_start, stop))
+                next_start = stop
+
+            # 队首即下一段连续帧，保证写入顺序
+            frames, profile_data = pending.popleft().result()
+            if on_profile and profile_data:
+                on_profile(profile_data)
+            for frame in frames:
+                if frame is None:
+                    frame = previous
+                previous = frame
+                yield frame
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+渲染分阶段计时
+记录每一帧各阶段（场景查找、背景、素材解码、缩放、字幕、标题、合成、颜色转换、编码）的耗时
+以及各级缓存的命中/未命中次数，输出:
+    profile.json          各阶段汇总统计与缓存计数
+    profile_frames.csv    逐帧各阶段耗时
+    profile_trace.json    Chrome Trace Event 格式，可在 chrome://tracing、Perfetto 或 speedscope 中查看火焰图
+"""
+
+import csv
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+
+import numpy as np
+
+STAGES = (
+    "scene_lookup", "background", "asset_decode", "resize",
+    "subtitle", "title", "composite", "colour_convert", "encode",
+)
+
+
+class NullProfiler:
+    """未开启性能分析时使用，所有方法均为空操作"""
+
+    enabled = False
+    _null = nullcontext()
+
+    def begin_frame(self, frame_idx):
+        pass
+
+    def end_frame(self):
+        pass
+
+    def stage(self, name, frame_idx=None):
+        return self._null
+
+    def count(self, name, n=1):
+        pass
+
+
+class RenderProfiler(NullProfiler):
+    enabled = True
+
+    def __init__(self):
+        self.frames = defaultdict(lambda: defaultdict(float))  # 帧序号 -> {阶段: 秒}
+        self.counters = defaultdict(int)
+        self.events = []
+        self.current_frame = None
+        self._frame_start = None
+        self._pid = os.getpid()
+
+    def begin_frame(self, frame_idx):
+        self.current_frame = frame_idx
+        self._frame_start = (time.time(), time.perf_counter())
+
+    def end_frame(self):
+        wall_start, start = self._frame_start
+        elapsed = time.perf_counter() - start
+        self.frames[self.current_frame]["render_total"] += elapsed
+        self._add_event(f"frame {self.current_frame}", wall_start, elapsed)
+        self.current_frame = None
+
+    @contextmanager
+    def stage(self, name, frame_idx=None):
+        frame_idx = self.current_frame if frame_idx is None else frame_idx
+        wall_start = time.time()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.frames[frame_idx][name] += elapsed
+            self._add_event(name, wall_start, elapsed)
+
+    def count(self, name, n=1):
+        self.counters[name] += n
+
+    def _add_event(self, name, wall_start, elapsed):
+        self.events.append({
+            "name": name,
+            "ph": "X",
+            "ts": int(wall_start * 1e6),
+            "dur": int(elapsed * 1e6),
+            "pid": self._pid,
+            "tid": threading.get_ident(),
+        })
+
+    def drain(self):
+        """取出并清空已记录的数据，供工作进程随渲染结果一起传回主进程"""
+        data = (
+            {idx: dict(stages) for idx, stages in self.frames.items()},
+            dict(self.counters),
+            self.events,
+        )
+        self.frames = defaultdict(lambda: defaultdict(float))
+        self.counters = defaultdict(int)
+        self.events = []
+        return data
+
+    def absorb(self, data):
+        """合并 drain() 的结果"""
+        frames, counters, events = data
+        for idx, stages in frames.items():
+            for name, seconds in stages.items():
+                self.frames[idx][name] += seconds
+        for name, n in counters.items():
+            self.counters[name] += n
+        self.events.extend(events)
+
+    def summary(self):
+        stages = {}
+        names = list(STAGES) + ["render_total"]
+        for name in names:
+            values = np.array([f[name] for f in self.frames.values() if name in f])
+            if values.size == 0:
+                continue
+            stages[name] = {
+                "total_s": float(values.sum()),
+                "mean_ms": float(values.mean() * 1000),
+                "p50_ms": float(np.percentile(values, 50) * 1000),
+                "p95_ms": float(np.percentile(values, 95) * 1000),
+                "max_ms": float(values.max() * 1000),
+                "frames": int(values.size),
+            }
+        return {
+            "frames": len(self.frames),
+            "stages": stages,
+            "counters": dict(sorted(self.counters.items())),
+        }
+
+    def write_report(self, output_dir):
+        os.makedirs(output_dir, exist_ok=True)
+        summary = self.summary()
+
+        with open(os.path.join(output_dir, "profile.json"), 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+
+        columns = [name for name in list(STAGES) + ["render_total"] if name in summary["stages"]]
+        with open(os.path.join(output_dir, "profile_frames.csv"), 'w', encoding='utf-8', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(["frame"] + [f"{name}_ms" for name in columns])
+            for idx in sorted(k for k in self.frames if k is not None):
+                stages = self.frames[idx]
+                writer.writerow([idx] + [f"{stages.get(name, 0.0) * 1000:.3f}" for name in columns])
+
+        with open(os.path.join(output_dir, "profile_trace.json"), 'w', encoding='utf-8') as f:
+            json.dump({"traceEvents": self.events, "displayTimeUnit": "ms"}, f)
+
+        return summary
+
+    def print_summary(self, summary=None):
+        summary = summary or self.summary()
+        print("\n==== 渲染性能分析 ====")
+        print(f"{'阶段':<16}{'总计(s)':>10}{'平均(ms)':>10}{'P95(ms)':>10}{'最大(ms)':>10}")
+        for name, stat in summary["stages"].items():
+            print(f"{name:<16}{stat['total_s']:>10.2f}{stat['mean_ms']:>10.2f}{stat['p95_ms']:>10.2f}{stat['max_ms']:>10.2f}")
+        print("缓存计数:")
+        for name, n in summary["counters"].items():
+            print(f"  {name}: {n}")
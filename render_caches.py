@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+"""
+可跨任务共享的渲染缓存
+批量渲染时同一进程内的多个 VideoGenerator 共用一份：
+素材读取器池、前景精灵、文字图层、背景图片、素材音频与字体
+各缓存的键都包含分辨率/帧率等区分信息，不同参数的任务不会串用
+"""
+
+from PIL import ImageFont
+
+from asset_catalogue import AssetCatalogue
+from audio_mixer import PcmCache
+from background_cache import DiskBackgroundCache
+from decoder_pool import DecoderPool
+from layer_cache import LayerCache
+from sprite_cache import SpriteCache
+
+
+class RenderCaches:
+    def __init__(self, sprite_cache_mb=512, background_cache_dir="cache/backgrounds",
+                 assets_root="./memes", refresh_catalogue=True, reader_pool_size=16, reader_cache_mb=1024):
+        # 素材读取器，键为 (asset_id, 解码参数, 输出帧率)，数量与解码帧内存有上限
+        self.reader_pool = DecoderPool(reader_pool_size, reader_cache_mb)
+        self.sprite_cache = SpriteCache(sprite_cache_mb)  # 已缩放的前景帧
+        self.layer_cache = LayerCache()  # 标题/字幕图层
+        self.background_cache_pool = {}  # 背景图片，键为 (搜索词, 分辨率)
+        self.pcm_cache = PcmCache()  # 素材音频
+        # 跨任务、跨进程共享的磁盘缓存，保存已缩放的背景
+        self.background_disk_cache = DiskBackgroundCache(background_cache_dir) if background_cache_dir else None
+        self.fonts = {}
+        # 素材索引，渲染时按 id 查表，不扫描目录；并行渲染的工作进程直接读取主进程刷新好的索引
+        self.catalogue = AssetCatalogue.load(assets_root, refresh=refresh_catalogue)
+
+    def close(self):
+        """关闭仍打开的素材读取器"""
+        self.reader_pool.close()
+
+    def font(self, size, path="font.ttf"):
+        key = (path, size)
+        if key not in self.fonts:
+            try:
+                self.fonts[key] = ImageFont.truetype(path, size)
+            except IOError:
+                self.fonts[key] = ImageFont.load_default(size=size)
+                print(f"警告：未找到 {path}，使用默认字体替代")
+        return self.fonts[key]
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+"""
+前景精灵缓存
+缓存已解码、已缩放并转换为预乘图层的素材帧，
+键为 (素材, 源帧序号, 目标尺寸)，按内存预算做 LRU 淘汰，
+循环播放的素材每个源帧只付出一次 Lanczos 缩放的代价
+"""
+
+from collections import OrderedDict
+
+
+class SpriteCache:
+    """按字节预算淘汰的 LRU 缓存，值为 compositor.Layer"""
+
+    def __init__(self, budget_mb=512):
+        self.budget_bytes = int(budget_mb * 1024 * 1024)
+        self.used_bytes = 0
+        self._sprites = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, render):
+        """命中时直接返回；未命中时调用 render() 生成图层并按预算淘汰旧条目"""
+        sprite = self._sprites.get(key)
+        if sprite is not None:
+            self._sprites.move_to_end(key)
+            self.hits += 1
+            return sprite
+
+        self.misses += 1
+        sprite = render()
+        size = sprite.nbytes
+        # 单个图层超过预算时不缓存
+        if size > self.budget_bytes:
+            return sprite
+
+        self._sprites[key] = sprite
+        self.used_bytes += size
+        while self.used_bytes > self.budget_bytes:
+            _, old = self._sprites.popitem(last=False)
+            self.used_bytes -= old.nbytes
+            self.evictions += 1
+        return sprite
+
+    def clear(self):
+        self._sprites.clear()
+        self.used_bytes = 0
+
+    def __len__(self):
+        return len(self._sprites)
@@ -93,7 +93,7 @@ def main():
     try:
         generator.generate_video()
         print("\n=== 视频生成成功！ ===")
-        print(f"输出文件: {generator.output_path}")
+        print(f"输出文件: {generator.result_path}")
     except Exception as e:
         print(f"\n=== 视频生成失败 ===")
         print(f"错误: {e}")
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""
+剧本时间轴
+剧本在渲染前编译一次：每个输出帧对应的场景预先算成数组，逐帧查找为 O(1)；
+每个场景对应一个 ScenePlan，首次用到时解析出背景、前景读取器与叠加图层，之后逐帧复用
+"""
+
+import numpy as np
+
+
+class ScenePlan:
+    """
+    单个场景的渲染计划
+    background: 已缩放的 BGR 背景数组（加载失败时为 None）
+    foregrounds: 已解析的前景列表，每项为 dict:
+        fg, reader_key, reader, size, x, y, subtitle,
+        source_indices: 场景内第 n 帧对应的源帧序号（按素材真实帧率循环）
+    reader_keys: 解析时从读取器池固定的读取器键，场景结束时逐个释放
+    base: 背景 + 字幕 + 标题合成好的底图
+    dirty_rect: 前景的并集包围盒 (x0, y0, x1, y1)，逐帧只重绘该区域
+    """
+
+    def __init__(self, index, scene):
+        self.index = index
+        self.scene = scene
+        self.start_time = scene['start_time']
+        self.end_time = scene['end_time']
+        self.resolved = False
+        self.background = None
+        self.foregrounds = []
+        self.reader_keys = []
+        self.base = None
+        self.dirty_rect = (0, 0, 0, 0)
+
+    def reset(self):
+        """丢弃解析结果，再次用到时重新解析（读取器可能已被池淘汰）"""
+        self.resolved = False
+        self.background = None
+        self.foregrounds = []
+        self.reader_keys = []
+        self.base = None
+        self.dirty_rect = (0, 0, 0, 0)
+
+    def frame_count(self, fps):
+        """场景内帧序号 int((t - start_time) * fps) 的上界（含余量）"""
+        return int((self.end_time - self.start_time) * fps) + 2
+
+
+class Timeline:
+    """帧序号 -> 场景计划 的查找表，与原先“按剧本顺序取第一个覆盖当前时间的场景”语义一致"""
+
+    def __init__(self, script, fps):
+        self.fps = fps
+        self.plans = [ScenePlan(i, scene) for i, scene in enumerate(script)]
+        self.total_frames = int(script[-1]['end_time'] * fps) if script else 0
+
+        # 倒序填充，重叠时剧本中靠前的场景覆盖靠后的
+        times = np.arange(self.total_frames) / fps
+        self.frame_scene = np.full(self.total_frames, -1, dtype=np.int32)
+        for plan in reversed(self.plans):
+            lo = np.searchsorted(times, plan.start_time, side='left')
+            hi = np.searchsorted(times, plan.end_time, side='left')
+            self.frame_scene[lo:hi] = plan.index
+
+    def plan_for_frame(self, frame_idx):
+        """返回该帧所属场景的计划，空白帧返回 None"""
+        if frame_idx >= self.total_frames:
+            return None
+        index = self.frame_scene[frame_idx]
+        return self.plans[index] if index >= 0 else None
+
+    def __len__(self):
+        return len(self.plans)